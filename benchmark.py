@@ -0,0 +1,387 @@
+"""Offline benchmarks for the bot's hot paths.
+
+Firebase is replaced by an in-memory tree and Telegram by a stub client, so
+nothing leaves the machine. Each corpus size runs in its own process (peak
+RSS is per size) and the results are written as JSON for comparing commits:
+
+    python benchmark.py                          # 10k, 100k and 1M files
+    python benchmark.py --sizes 10000 --out before.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import logging
+import resource
+import subprocess
+import tempfile
+
+SEED = 7
+QUERIES = 300          # searches timed per corpus
+KEYSTROKE_USERS = 30   # inline sessions typed one character at a time
+SUGGESTIONS = 100      # misspelled queries for the fuzzy path
+TITLE_PARSES = 20000
+INGEST = 2000          # files added one by one through add_file_to_db
+INDEX_MESSAGES = 20000 # channel history walked by run_index (/index)
+DELETES = 20000        # auto-delete tasks drained
+
+# --- Synthetic corpus ---
+WORDS = (
+    "iron man spider avengers endgame dark knight rises batman begins joker godfather matrix reloaded star wars "
+    "hope empire strikes return jedi lord rings fellowship towers king lion jungle book toy story frozen moana "
+    "inception interstellar dune mission impossible fast furious fate john wick parabellum money heist breaking "
+    "bad better call saul game thrones house dragon stranger things crown witcher mandalorian squid peaky blinders "
+    "office friends sherlock narcos vikings boys chernobyl wednesday loki ozark fargo dexter lost prison break "
+    "the of a and in to last first night day man woman love war city world secret ghost blood shadow fire ice"
+).split()
+YEARS = list(range(1975, 2025))
+QUALITIES = ["480p", "720p", "1080p", "2160p", "4K"]
+SOURCES = ["BluRay", "WEB-DL", "WEBRip", "HDRip", "DVDRip", "HDTV", "HDCAM"]
+CODECS = ["x264", "x265", "HEVC", "H.264", "10bit"]
+AUDIO = ["AAC", "DD5.1", "AC3", "DTS", "Atmos"]
+LANGUAGES = ["Hindi", "English", "Tamil", "Telugu", "Malayalam", "Korean", "Dual Audio", "Multi"]
+GROUPS = ["YTS", "RARBG", "PSA", "Pahe", "TGx", "GalaxyRG", "MkvCinemas"]
+CHANNELS = ["@MoviesHub", "@CineVault", "@SeriesZone", "@FilmBox"]
+EXTENSIONS = [".mkv", ".mkv", ".mp4", ".avi"]
+
+def make_titles(rng, count):
+    titles = set()
+    while len(titles) < count:
+        titles.add(" ".join(w.capitalize() for w in rng.sample(WORDS, rng.randint(1, 4))))
+    return sorted(titles)
+
+def release_name(rng, title, year):
+    """One file name in one of the layouts release channels actually use."""
+    dotted = title.replace(" ", ".")
+    quality, source, codec = rng.choice(QUALITIES), rng.choice(SOURCES), rng.choice(CODECS)
+    layout = rng.randrange(5)
+    if layout == 0: name = f"{dotted}.{year}.{quality}.{source}.{codec}-{rng.choice(GROUPS)}"
+    elif layout == 1: name = f"[{rng.choice(CHANNELS)[1:]}] {title} ({year}) {quality} {rng.choice(LANGUAGES)} {rng.choice(AUDIO)}"
+    elif layout == 2: name = f"{dotted}.S{rng.randint(1, 9):02d}E{rng.randint(1, 24):02d}.{quality}.{source}.{codec}"
+    elif layout == 3: name = f"{rng.choice(CHANNELS)} {title} {year} {rng.choice(LANGUAGES)} {quality} {codec}"
+    else: name = f"{title.replace(' ', '_')}_{year}_{quality}_{source}"
+    return name + rng.choice(EXTENSIONS)
+
+def make_corpus(size, seed=SEED):
+    """(files, titles): file records as the indexer stores them, plus the titles used."""
+    rng = random.Random(seed)
+    titles = make_titles(rng, max(50, size // 20))
+    years = {title: rng.choice(YEARS) for title in titles}
+    files = []
+    for i in range(size):
+        title = rng.choice(titles)
+        name = release_name(rng, title, years[title])
+        caption = name if rng.random() < 0.7 else f"{name}\n\nJoin {rng.choice(CHANNELS)} for more"
+        files.append({
+            "file_name": name, "file_size": rng.randint(100 << 20, 8 << 30), "caption": caption,
+            "file_id": f"BQACAgUAAxkBAAI{i:012d}{rng.getrandbits(64):016x}", "unique_id": f"AgAD{i:010d}",
+            "updated_at": 0
+        })
+    return files, titles
+
+def misspell(rng, text):
+    chars = list(text.lower())
+    for _ in range(max(1, len(chars) // 6)):
+        i = rng.randrange(len(chars))
+        op = rng.randrange(3)
+        if op == 0: chars[i] = rng.choice("abcdefghijklmnopqrstuvwxyz")
+        elif op == 1 and len(chars) > 3: del chars[i]
+        else: chars.insert(i, rng.choice("aeiou"))
+    return "".join(chars)
+
+# --- Firebase stand-in ---
+class FakeQuery:
+    def __init__(self, node, key):
+        self.node, self.key, self.since = node, key, None
+
+    def start_at(self, value):
+        self.since = value
+        return self
+
+    def get(self):
+        items = (self.node or {}).items()
+        value = (lambda v: v) if self.key is None else (lambda v: v.get(self.key, 0))
+        return {k: v for k, v in items if self.since is None or value(v) >= self.since}
+
+class FakeReference:
+    def __init__(self, root, path):
+        self.root, self.parts = root, [p for p in path.strip("/").split("/") if p]
+
+    def _node(self):
+        node = self.root
+        for part in self.parts:
+            if not isinstance(node, dict) or part not in node: return None
+            node = node[part]
+        return node
+
+    def get(self, shallow=False):
+        node = self._node()
+        if shallow and isinstance(node, dict): return {k: True for k in node}
+        # The SDK hands back freshly decoded JSON; the copy keeps that cost in the numbers
+        return json.loads(json.dumps(node)) if node is not None else None
+
+    def set(self, value):
+        if not self.parts:
+            self.root.clear()
+            self.root.update(value or {})
+            return
+        node = self.root
+        for part in self.parts[:-1]: node = node.setdefault(part, {})
+        if value is None: node.pop(self.parts[-1], None)
+        else: node[self.parts[-1]] = json.loads(json.dumps(value))
+
+    def update(self, values):
+        base = "/".join(self.parts)
+        for key, value in values.items(): FakeReference(self.root, f"{base}/{key}").set(value)
+
+    def delete(self):
+        self.set(None)
+
+    def order_by_child(self, key):
+        return FakeQuery(self._node(), key)
+
+    def order_by_value(self):
+        return FakeQuery(self._node(), None)
+
+class FakeDb:
+    """Just enough of firebase_admin.db: reference() over a nested dict."""
+    def __init__(self):
+        self.root = {}
+
+    def reference(self, path="/"):
+        return FakeReference(self.root, path)
+
+# --- Telegram stand-in ---
+class StubChat:
+    def __init__(self, chat_id, chat_type):
+        self.id, self.type = chat_id, chat_type
+
+class StubMessage:
+    ids = 0
+
+    def __init__(self, client, chat, text=""):
+        StubMessage.ids += 1
+        self.client, self.chat, self.id, self.text = client, chat, StubMessage.ids, text
+
+    async def reply_text(self, text, reply_markup=None):
+        self.client.calls += 1
+        return StubMessage(self.client, self.chat, text)
+
+    async def edit_text(self, text, reply_markup=None):
+        self.client.calls += 1
+        self.text = text
+        return self
+
+class StubInlineQuery:
+    def __init__(self, user_id, text, offset=""):
+        self.from_user = type("User", (), {"id": user_id})()
+        self.query, self.offset = text, offset
+        self.answered = None
+
+    async def answer(self, results, cache_time=0, is_personal=False, next_offset=""):
+        self.answered = (len(results), next_offset)
+
+class StubMedia:
+    def __init__(self, file_data):
+        self.file_name, self.file_size = file_data["file_name"], file_data["file_size"]
+        self.file_id, self.file_unique_id = file_data["file_id"], file_data["unique_id"]
+
+class StubPost:
+    """A channel message as get_chat_history() yields it."""
+    def __init__(self, message_id, file_data=None):
+        self.id, self.video = message_id, None
+        self.document = StubMedia(file_data) if file_data else None
+        self.caption = file_data["caption"] if file_data else None
+
+class StubClient:
+    """Records what the bot would have sent instead of talking to Telegram."""
+    def __init__(self):
+        self.calls = 0
+        self.deleted = 0
+        self.history = []  # channel posts, newest first
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls += 1
+        return StubMessage(self, StubChat(chat_id, None), text)
+
+    async def send_cached_media(self, chat_id, file_id, caption=""):
+        self.calls += 1
+        return StubMessage(self, StubChat(chat_id, None), caption)
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.calls += 1
+        self.deleted += len(message_ids)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        self.calls += 1
+
+    async def get_chat_history(self, chat_id, offset_id=0):
+        for post in self.history:
+            if not offset_id or post.id < offset_id: yield post
+
+# --- Measurement ---
+def summarize(samples, elapsed=None):
+    """Latency percentiles (ms) and throughput for a list of per-operation seconds."""
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000
+    total = elapsed if elapsed is not None else sum(ordered)
+    return {
+        "n": len(ordered), "p50_ms": round(pick(0.50), 4), "p99_ms": round(pick(0.99), 4),
+        "max_ms": round(ordered[-1] * 1000, 4), "ops_per_s": round(len(ordered) / total, 1) if total else None
+    }
+
+def peak_rss_mb():
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+async def timed_calls(calls):
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        await call()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+async def run_size(size, workdir):
+    os.environ["SNAPSHOT_FILE"] = os.path.join(workdir, "files_snapshot.jsonl")
+    os.environ["IMDB_CACHE_FILE"] = os.path.join(workdir, "imdb_cache.json")
+    import main
+    from pyrogram import enums
+    logging.getLogger("BSFilterBot").setLevel(logging.WARNING)
+    main.db = FakeDb()
+    main.IMDB_AVAILABLE = False  # suggestions take the fuzzy path, never the network
+    main.BOT_USERNAME = "BenchBot"
+    rng = random.Random(SEED)
+    results = {"files": size}
+
+    files, titles = make_corpus(size)
+    main.db.reference("files").set({f["unique_id"]: f for f in files})
+    results["corpus_rss_mb"] = peak_rss_mb()
+
+    # extract_proper_movie_title
+    names = [f["file_name"] for f in rng.sample(files, min(TITLE_PARSES, size))]
+    samples = []
+    for name in names:
+        start = time.perf_counter()
+        main.extract_proper_movie_title(name)
+        samples.append(time.perf_counter() - start)
+    results["extract_proper_movie_title"] = summarize(samples)
+
+    # refresh_cache: full download, then the snapshot + delta path a restart takes
+    start = time.perf_counter()
+    main.refresh_cache()
+    results["refresh_cache_full"] = {"seconds": round(time.perf_counter() - start, 3), "files_per_s": round(size / (time.perf_counter() - start))}
+    del files
+    start = time.perf_counter()
+    main.refresh_cache()
+    results["refresh_cache_snapshot"] = {"seconds": round(time.perf_counter() - start, 3), "files_per_s": round(size / (time.perf_counter() - start))}
+    results["loaded_rss_mb"] = peak_rss_mb()
+
+    client = StubClient()
+    private = StubChat(1, enums.ChatType.PRIVATE)
+
+    # perform_search: known titles, title + facet, partial words and misses; cold then cached
+    queries = []
+    for _ in range(QUERIES):
+        title = rng.choice(titles)
+        kind = rng.randrange(4)
+        if kind == 0: queries.append(title)
+        elif kind == 1: queries.append(f"{title} {rng.choice(['1080p', '720p', 'x265', 'S01E02', 'hindi'])}")
+        elif kind == 2: queries.append(" ".join(w[:max(3, len(w) - 2)] for w in title.split()))
+        else: queries.append(misspell(rng, title))
+    search = lambda q: (lambda: main.perform_search(client, StubMessage(client, private, q), q))
+    main.QUERY_CACHE.clear()
+    main.QUERY_SUGGESTIONS.clear()
+    results["perform_search_cold"] = summarize(await timed_calls([search(q) for q in queries]))
+    results["perform_search_cached"] = summarize(await timed_calls([search(q) for q in queries]))
+
+    # inline_handler: users typing a title one key at a time, then scrolling one page
+    main.QUERY_CACHE.clear()
+    keystrokes = []
+    for user in range(KEYSTROKE_USERS):
+        title = rng.choice(titles)
+        for i in range(2, len(title) + 1):
+            keystrokes.append(lambda u=user, t=title[:i]: main.inline_handler(client, StubInlineQuery(u, t)))
+        keystrokes.append(lambda u=user, t=title: main.inline_handler(client, StubInlineQuery(u, t, str(main.INLINE_PAGE_SIZE))))
+    results["inline_handler"] = summarize(await timed_calls(keystrokes))
+
+    # get_smart_suggestions, fuzzy path only
+    if main.FUZZY_AVAILABLE:
+        typos = [misspell(rng, rng.choice(titles)) for _ in range(SUGGESTIONS)]
+        results["get_smart_suggestions_fuzzy"] = summarize(await timed_calls([lambda q=q: main.get_smart_suggestions(q) for q in typos]))
+
+    # add_file_to_db, one file at a time as new channel posts arrive
+    new_files, _ = make_corpus(INGEST, seed=SEED + 1)
+    for f in new_files: f["unique_id"] = "new" + f["unique_id"]
+    start = time.perf_counter()
+    samples = await timed_calls([lambda f=f: main.add_file_to_db(f) for f in new_files])
+    results["add_file_to_db"] = summarize(samples, time.perf_counter() - start)
+
+    # run_index: a channel's history walked by /index, one in five posts being text
+    index_files, _ = make_corpus(INDEX_MESSAGES, seed=SEED + 2)
+    for f in index_files: f["unique_id"] = "idx" + f["unique_id"]
+    client.history = [StubPost(INDEX_MESSAGES - i, f if i % 5 else None) for i, f in enumerate(index_files)]
+    state = {
+        "chat_id": -100, "title": "Bench Channel", "high": 0, "status_chat": 1, "status_id": 1,
+        "top": 0, "next": 0, "scanned": 0, "added": 0, "failed": 0
+    }
+    start = time.perf_counter()
+    await main.run_index(client, state)
+    elapsed = time.perf_counter() - start
+    client.history = []
+    results["run_index"] = {
+        "messages": state["scanned"], "files": state["added"], "seconds": round(elapsed, 3),
+        "messages_per_s": round(state["scanned"] / elapsed), "files_per_s": round(state["added"] / elapsed)
+    }
+
+    # Delete queue: a backlog of due tasks drained by the scheduler loop
+    now = time.time()
+    for i in range(DELETES): main.DELETE_SCHEDULER.add(1000 + i % 50, i, now - 1)
+    start = time.perf_counter()
+    runner = asyncio.create_task(main.DELETE_SCHEDULER.run(client))
+    while client.deleted < DELETES: await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    runner.cancel()
+    results["delete_queue"] = {"tasks": DELETES, "seconds": round(elapsed, 3), "tasks_per_s": round(DELETES / elapsed)}
+
+    await main.FIREBASE.flush()
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+def git_commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), text=True).strip()
+    except Exception: return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)  # one size, results on stdout
+    args = parser.parse_args()
+
+    if args.child:
+        with tempfile.TemporaryDirectory() as workdir:
+            print(json.dumps(asyncio.run(run_size(args.child, workdir))))
+        return
+
+    report = {"commit": git_commit(), "python": sys.version.split()[0], "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": {}}
+    for size in args.sizes:
+        print(f"⏱️ {size} files...", flush=True)
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(size)], capture_output=True, text=True)
+        if proc.returncode:
+            print(proc.stderr, file=sys.stderr)
+            report["results"][str(size)] = {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"}
+            continue
+        report["results"][str(size)] = result = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(
+            f"   search p50 {result['perform_search_cold']['p50_ms']} ms, p99 {result['perform_search_cold']['p99_ms']} ms, "
+            f"inline p99 {result['inline_handler']['p99_ms']} ms, index {result['run_index']['files_per_s']} files/s, "
+            f"peak RSS {result['peak_rss_mb']} MB"
+        )
+    with open(args.out, "w") as f: json.dump(report, f, indent=2)
+    print(f"✅ Saved {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,31 @@
 import os
+import sys
 import json
 import math
 import logging
 import asyncio
 import threading
+import multiprocessing
+import signal
+import gc
 import re
 import time
 import psutil
 import uuid
+import bisect
+import functools
+import heapq
+from array import array
+from itertools import islice
+from collections import OrderedDict, Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
 # Pyrogram
 from pyrogram import Client, filters, enums
+from pyrogram.errors import (
+    FloodWait, UserIsBlocked, InputUserDeactivated, UserDeactivated, UserDeactivatedBan
+)
 from pyrogram.types import (
     InlineKeyboardMarkup,
     InlineKeyboardButton,
@@ -25,7 +39,7 @@ from firebase_admin import credentials, db
 
 # Fuzzy Search (RapidFuzz)
 try:
-    from rapidfuzz import process, fuzz
+    from rapidfuzz import process, fuzz, utils
     FUZZY_AVAILABLE = True
 except ImportError:
     print("⚠️ RapidFuzz not installed. Run: pip install rapidfuzz")
@@ -57,6 +71,45 @@ RESULT_MSG_DELETE_TIME = 600   # 10 Minutes
 USER_MSG_DELETE_TIME = 300     # 5 Minutes
 SUGGESTION_DELETE_TIME = 300   # 5 Minutes
 
+# INDEXING
+INDEX_CHUNK_SIZE = 500         # Files per multi-path Firebase update
+INDEX_MAX_PENDING_CHUNKS = 4   # History fetching pauses when the writer is this far behind
+INDEX_WRITE_RETRIES = 3
+INDEX_STATUS_INTERVAL = 5      # Seconds between progress edits
+
+# IMDB
+IMDB_WORKERS = 2               # Dedicated threads; lookups beyond this fall back to fuzzy
+IMDB_TIMEOUT = 4               # Seconds before falling back to fuzzy
+IMDB_CACHE_FILE = os.environ.get("IMDB_CACHE_FILE", "imdb_cache.json")
+IMDB_CACHE_SIZE = 20000
+IMDB_CACHE_TTL = 7 * 86400
+IMDB_NEGATIVE_TTL = 86400      # Queries IMDb had nothing for
+IMDB_SAVE_INTERVAL = 60
+
+# BROADCAST
+BROADCAST_RATE = 25            # Messages/second overall; Telegram allows bots about 30
+BROADCAST_SENDERS = 10         # Concurrent message copies
+BROADCAST_REPORT_INTERVAL = 10 # Seconds between checkpoints and status edits
+
+# INLINE
+INLINE_PAGE_SIZE = 50          # Telegram's limit per answer
+INLINE_MAX_RESULTS = 1000      # Ranked results reachable by scrolling
+INLINE_SESSION_TTL = 300       # Seconds a user's last inline match set is kept for narrowing
+INLINE_SESSION_MAX = INLINE_MAX_RESULTS * 10  # Bigger match sets aren't kept; the index narrows them as fast
+INLINE_CACHE_MIN = 10          # cache_time bounds; it follows how often files change
+INLINE_CACHE_MAX = 300
+
+# SEARCH WORKERS
+SEARCH_WORKERS = int(os.environ.get("SEARCH_WORKERS", 0))  # Worker processes for search; 0 keeps it on the loop
+SEARCH_WORKER_TIMEOUT = 5      # Seconds before a lookup falls back to the loop
+
+# SNAPSHOT & SYNC
+SNAPSHOT_FILE = os.environ.get("SNAPSHOT_FILE", "files_snapshot.jsonl")
+SNAPSHOT_VERSION = 4           # Bump whenever normalize_file() output changes
+SNAPSHOT_INTERVAL = 300        # Seconds between snapshot rewrites (only when files changed)
+SYNC_INTERVAL = 30             # Seconds between Firebase delta syncs
+SYNC_OVERLAP = 60 * 1000       # ms re-read before the cursor, covers clock skew between instances
+
 # LOGGING
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger("BSFilterBot")
@@ -72,103 +125,561 @@ if not firebase_admin._apps:
     except Exception as e:
         logger.error(f"❌ Firebase Init Error: {e}")
 
+# BOUNDED CACHE
+class TTLCache:
+    """Dict-like cache with a size cap (LRU eviction) and a fixed lifetime per entry."""
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        entry = self.data.get(key)
+        if entry is None or entry[0] < time.time():
+            if entry is not None:
+                del self.data[key]
+                self.evictions += 1
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        self.data[key] = (time.time() + self.ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+
+    def stats(self):
+        return f"{len(self.data)} items, {self.hits} hits, {self.misses} misses, {self.evictions} evicted"
+
+# METRICS
+class Histogram:
+    """Prometheus-style latency histogram; observed on the event loop, read by the HTTP thread."""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+LATENCY = {}  # operation -> Histogram
+LOOP_LAG = {"last": 0.0, "max": 0.0}  # seconds the event loop was late to wake a sleeper
+
+def timed(name):
+    """Record every call of the wrapped coroutine function in LATENCY[name]."""
+    histogram = LATENCY.setdefault(name, Histogram())
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try: return await fn(*args, **kwargs)
+            finally: histogram.observe(time.perf_counter() - start)
+        return wrapper
+    return decorator
+
+# FILE STORE
+class PackedStrings:
+    """Append-only string column: one UTF-8 buffer plus an offsets array (8 bytes per value)."""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offsets = array('q', [0])
+
+    def append(self, text):
+        self.buffer += text.encode()
+        self.offsets.append(len(self.buffer))
+
+    def __getitem__(self, row):
+        return self.buffer[self.offsets[row]:self.offsets[row + 1]].decode()
+
+    def nbytes(self):
+        return sys.getsizeof(self.buffer) + sys.getsizeof(self.offsets)
+
+class FileStore:
+    """File records in columns, addressed by integer row ids.
+
+    Rows are appended in insertion order and never reused or rewritten while
+    the bot runs, so a row id held by a search result always names the same
+    file, and columns can be read off the loop (snapshots). Deleted rows only
+    lose their normalized fields; their bytes are reclaimed on the next start.
+    """
+    FIELDS = ("file_name", "file_size", "file_id", "unique_id", "caption", "updated_at")
+
+    def __init__(self):
+        self.rows = {}        # unique_id -> live row
+        self.unique_ids = []  # row -> unique_id
+        self.names = PackedStrings()
+        self.captions = PackedStrings()  # "" when the caption is just the file name (the indexer default)
+        self.file_ids = PackedStrings()
+        self.sizes = array('q')
+        self.updated = array('q')
+        self.norms = []       # row -> Norm from normalize_file(), None once deleted
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, unique_id):
+        return unique_id in self.rows
+
+    def add(self, file_data, norm):
+        row = len(self.unique_ids)
+        name = file_data.get('file_name') or ''
+        caption = file_data.get('caption') or ''
+        self.unique_ids.append(sys.intern(file_data['unique_id']))
+        self.names.append(name)
+        self.captions.append('' if caption == name else caption)
+        self.file_ids.append(file_data['file_id'])
+        self.sizes.append(file_data.get('file_size') or 0)
+        self.updated.append(file_data.get('updated_at', 0))
+        self.norms.append(norm)
+        self.rows[self.unique_ids[row]] = row
+        return row
+
+    def remove(self, unique_id):
+        row = self.rows.pop(unique_id, None)
+        if row is not None: self.norms[row] = None
+        return row
+
+    def row(self, unique_id):
+        return self.rows.get(unique_id)
+
+    def record(self, row):
+        """The file as the dict Firebase stores."""
+        name = self.names[row]
+        return {
+            "file_name": name, "file_size": self.sizes[row], "file_id": self.file_ids[row],
+            "unique_id": self.unique_ids[row], "caption": self.captions[row] or name, "updated_at": self.updated[row]
+        }
+
+    def file(self, row):
+        return self.record(row) if self.norms[row] is not None else None
+
+    def get(self, unique_id):
+        row = self.rows.get(unique_id)
+        return None if row is None else self.record(row)
+
+    def live_rows(self):
+        return (row for row, norm in enumerate(self.norms) if norm is not None)
+
+    def memory_report(self, sample=2000):
+        """Bytes held by the columns vs. the same files kept as one dict each (estimated from a sample)."""
+        columns = (
+            self.names.nbytes() + self.captions.nbytes() + self.file_ids.nbytes() + sys.getsizeof(self.sizes)
+            + sys.getsizeof(self.updated) + sys.getsizeof(self.unique_ids) + sys.getsizeof(self.rows)
+        )
+        rows = list(islice(self.live_rows(), sample))
+        per_dict = 0
+        for row in rows:
+            # Decoded JSON gives every value its own object; unique_id is shared with the key in both layouts
+            record = self.record(row)
+            per_dict += sys.getsizeof(record) + sum(sys.getsizeof(v) for k, v in record.items() if k != "unique_id")
+        dicts = sys.getsizeof(self.rows) + (per_dict / len(rows) * len(self) if rows else 0)
+        # Titles, title keys and facet pairs are shared between files, so only names/captions count
+        per_norm = sum(
+            sys.getsizeof(norm) + sys.getsizeof(norm.name) + (sys.getsizeof(norm.caption) if norm.caption is not norm.name else 0)
+            for norm in map(self.norms.__getitem__, rows) if norm is not None
+        )
+        norms = sys.getsizeof(self.norms) + (per_norm / len(rows) * len(self) if rows else 0)
+        per_file = lambda total: int(total / len(self)) if len(self) else 0
+        return (
+            f"Columnar: {get_size(columns)} ({per_file(columns)} B/file, {len(self.unique_ids) - len(self)} deleted rows)\n"
+            f"Dicts (est.): {get_size(dicts)} ({per_file(dicts)} B/file)\n"
+            f"Norms (est.): {get_size(norms)} ({per_file(norms)} B/file)"
+        )
+
 # GLOBAL CACHE
-FILES_CACHE = []
-SEARCH_DATA_CACHE = {}
-MOVIE_TITLES_CACHE = []
-SUGGESTION_CACHE = {}
+FILE_STORE = FileStore()  # every indexed file; search results hold its row ids
+SEARCH_DATA_CACHE = TTLCache(maxsize=2000, ttl=RESULT_MSG_DELETE_TIME)  # search_id -> {"ids"/"groups" (rows), "total", "parent"}
+MOVIE_TITLES_CACHE = []  # sorted, maintained incrementally from TITLE_COUNTS
+TITLE_COUNTS = {}      # title -> number of cached files carrying it
+USER_IDS = set()       # registry of every user, loaded once by load_users()
+SYNC_STATE = {"cursor": 0, "dirty": False}  # newest `updated_at` seen (ms), unsnapshotted changes
+CORPUS_CHANGES = {"at": time.time(), "interval": INLINE_CACHE_MAX * 2}  # last file change, average gap (s)
+SUGGESTION_CACHE = TTLCache(maxsize=5000, ttl=SUGGESTION_DELETE_TIME)  # short_id -> title
+QUERY_CACHE = TTLCache(maxsize=1000, ttl=RESULT_MSG_DELETE_TIME)  # query key -> search_files() result, cleared on file changes
+QUERY_SUGGESTIONS = TTLCache(maxsize=1000, ttl=SUGGESTION_DELETE_TIME)  # query key -> suggestions
+IN_FLIGHT = {}  # key -> task, shared by concurrent identical requests
+INLINE_SESSIONS = TTLCache(maxsize=5000, ttl=INLINE_SESSION_TTL)  # user_id -> (query, index version, array of matching rows)
+IMDB_CACHE = TTLCache(maxsize=IMDB_CACHE_SIZE, ttl=IMDB_CACHE_TTL)  # clean query -> IMDb titles
+IMDB_MISSES = TTLCache(maxsize=IMDB_CACHE_SIZE, ttl=IMDB_NEGATIVE_TTL)  # clean query -> True
+IMDB_STATS = {"busy": 0, "lookups": 0, "timeouts": 0, "errors": 0, "unsaved": 0}
+IMDB_EXECUTOR = ThreadPoolExecutor(max_workers=IMDB_WORKERS, thread_name_prefix="imdb")
+SEARCH_POOL = None  # SearchPool once started with SEARCH_WORKERS > 0
 BOT_USERNAME = ""
 RESULTS_PER_PAGE = 10
+MAX_RESULTS = 100              # Best-ranked files kept per search (10 pages)
 
 # ==============================================================================
 # 📂 DATABASE FUNCTIONS
 # ==============================================================================
+class FirebaseRepo:
+    """Awaitable Firebase access for handlers.
+
+    The SDK blocks, so calls run on a dedicated pool sized to the SDK's shared
+    HTTP session (requests keeps 10 pooled connections per host), which keeps
+    every connection reused. Fire-and-forget writes are buffered briefly and
+    sent together as one multi-path update.
+    """
+    WORKERS = 8
+    FLUSH_DELAY = 1  # Seconds a buffered write waits for others to join it
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.WORKERS, thread_name_prefix="firebase")
+        self.buffer = {}  # path -> value, None deletes
+        self.flush_handle = None
+
+    async def run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    @timed("firebase_get")
+    async def get(self, path, shallow=False):
+        return await self.run(lambda: db.reference(path).get(shallow=shallow))
+
+    @timed("firebase_set")
+    async def set(self, path, value):
+        await self.run(lambda: db.reference(path).set(value))
+
+    @timed("firebase_update")
+    async def update(self, path, values):
+        await self.run(lambda: db.reference(path).update(values))
+
+    @timed("firebase_delete")
+    async def delete(self, path):
+        await self.run(lambda: db.reference(path).delete())
+
+    @timed("firebase_delta")
+    async def delta(self, cursor):
+        return await self.run(fetch_delta, cursor)
+
+    def write_behind(self, path, value):
+        self.buffer[path] = value
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self.flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self.flush_handle = loop.call_later(self.FLUSH_DELAY, lambda: loop.create_task(self.flush()))
+
+    async def flush(self):
+        self.flush_handle = None
+        batch, self.buffer = self.buffer, {}
+        if not batch: return
+        try: await self.update('/', batch)
+        except Exception as e:
+            logger.error(f"Firebase Flush Error: {e}")
+            # Retry later; writes buffered meanwhile are newer and win
+            self.buffer = {**batch, **self.buffer}
+            self._schedule_flush()
+
+    def flush_sync(self):
+        """Shutdown path, once the event loop has stopped."""
+        batch, self.buffer = self.buffer, {}
+        if batch:
+            try: db.reference('/').update(batch)
+            except Exception as e: logger.error(f"Firebase Flush Error: {e}")
+
+FIREBASE = FirebaseRepo()
+
 def refresh_cache():
-    global FILES_CACHE, MOVIE_TITLES_CACHE
+    """Startup load: local snapshot plus a Firebase delta, or a full download without one."""
+    if load_snapshot():
+        try: return apply_delta(*fetch_delta(SYNC_STATE['cursor']))
+        # Without the delta the snapshot is stale (e.g. missing .indexOn rules): download everything
+        except Exception as e: logger.error(f"Delta Sync Error: {e}, falling back to a full download")
     try:
-        ref = db.reference('files')
-        snapshot = ref.get()
-        if snapshot:
-            FILES_CACHE = list(snapshot.values())
-            logger.info(f"🚀 Cache Refreshed: {len(FILES_CACHE)} files in RAM")
-            MOVIE_TITLES_CACHE = extract_movie_titles_from_files()
-        else:
-            FILES_CACHE = []
-            MOVIE_TITLES_CACHE = []
+        cursor = now_ms()
+        snapshot = db.reference('files').get()
+        load_cache((f, normalize_file(f)) for f in (snapshot or {}).values())
+        del snapshot
+        SYNC_STATE['cursor'] = cursor
+        write_snapshot(*snapshot_rows())
     except Exception as e:
         logger.error(f"Cache Refresh Error: {e}")
 
-def extract_movie_titles_from_files():
-    titles_set = set()
-    for file in FILES_CACHE:
-        title = extract_proper_movie_title(file.get('file_name', ''))
-        if title: titles_set.add(title)
-    return sorted(list(titles_set))
+def load_cache(pairs):
+    """Replace every cache from (file record, normalized fields) pairs, consumed one at a time."""
+    global FILE_STORE, MOVIE_TITLES_CACHE, TITLE_COUNTS
+    FILE_STORE = FileStore()
+    TITLE_COUNTS = {}
+    for file_data, norm in pairs:
+        if file_data['unique_id'] in FILE_STORE: continue
+        FILE_STORE.add(file_data, norm)
+        if norm.title: TITLE_COUNTS[norm.title] = TITLE_COUNTS.get(norm.title, 0) + 1
+    logger.info(f"🚀 Cache Refreshed: {len(FILE_STORE)} files in RAM")
+    MOVIE_TITLES_CACHE = sorted(TITLE_COUNTS)
+    if TITLE_MATCHER: TITLE_MATCHER.rebuild(MOVIE_TITLES_CACHE)
+    SEARCH_INDEX.rebuild(FILE_STORE.live_rows())
+    QUERY_CACHE.clear()
+    SEARCH_DATA_CACHE.clear()  # row ids start over
+    logger.info(f"🗂️ Index Built: {len(SEARCH_INDEX.postings)} tokens")
 
-def extract_proper_movie_title(text):
-    if not text: return None
-    text = re.sub(r'\.(mkv|mp4|avi|mov|flv|wmv|webm|m4v|3gp|vob)$', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'[\s\._-]*(720p|1080p|4k|2160p|hd|fullhd|bluray|webdl|webrip|dvdrip|brrip|hdtv|hdcam|camrip|ts|tc|scr|dvdscr|r5|bdrip)[\s\._-]*', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(r'[\s\._-]*(x264|x265|h264|h265|aac|ac3|dd5\.1|dts|hevc)[\s\._-]*', ' ', text, flags=re.IGNORECASE)
-    text = re.sub(r'\[.*?\]', '', text)
-    text = re.sub(r'@\w+', '', text)
-    text = re.sub(r'[._-]+', ' ', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    year_match = re.search(r'\((\d{4})\)', text)
+def now_ms():
+    return int(time.time() * 1000)
+
+# --- Snapshot & Delta Sync ---
+def snapshot_rows():
+    """Consistent view for write_snapshot(); taken on the loop, written off it.
+    Records are read from the store while writing, its columns never change under a row."""
+    return [(row, FILE_STORE.norms[row]) for row in FILE_STORE.live_rows()], SYNC_STATE['cursor']
+
+def write_snapshot(rows, cursor):
+    """JSON lines: a header, then one [record, normalized fields] pair per file."""
+    store = FILE_STORE
+    try:
+        with open(SNAPSHOT_FILE + ".tmp", "w") as f:
+            f.write(json.dumps({"version": SNAPSHOT_VERSION, "cursor": cursor, "count": len(rows)}) + "\n")
+            for row, norm in rows: f.write(json.dumps([store.record(row), norm], separators=(",", ":")) + "\n")
+        os.replace(SNAPSHOT_FILE + ".tmp", SNAPSHOT_FILE)
+        logger.info(f"💾 Snapshot Saved: {len(rows)} files")
+    except Exception as e: logger.error(f"Snapshot Save Error: {e}")
+
+def load_snapshot():
+    """Stream the snapshot line by line; normalized fields are reused unless the format changed."""
+    try:
+        with open(SNAPSHOT_FILE) as f:
+            header = json.loads(f.readline())
+            fresh = header.get("version") == SNAPSHOT_VERSION
+            load_cache((file_data, make_norm(*norm) if fresh else normalize_file(file_data)) for file_data, norm in map(json.loads, f))
+        SYNC_STATE['cursor'] = header['cursor']
+        SYNC_STATE['dirty'] = not fresh
+        return True
+    except FileNotFoundError: return False
+    except Exception as e:
+        logger.error(f"Snapshot Load Error: {e}")
+        return False
+
+def fetch_delta(cursor):
+    """Files written and deleted since `cursor` (needs .indexOn updated_at / .value rules)."""
+    since = cursor - SYNC_OVERLAP
+    changed = db.reference('files').order_by_child('updated_at').start_at(since).get() or {}
+    deleted = db.reference('deleted_files').order_by_value().start_at(since).get() or {}
+    return changed, deleted
+
+def apply_delta(changed, deleted):
+    for unique_id, deleted_at in deleted.items():
+        row = FILE_STORE.row(unique_id)
+        if row is not None and FILE_STORE.updated[row] <= deleted_at: uncache_file(unique_id)
+        SYNC_STATE['cursor'] = max(SYNC_STATE['cursor'], deleted_at)
+    for file_data in changed.values():
+        if file_data['unique_id'] not in FILE_STORE and deleted.get(file_data['unique_id'], 0) < file_data['updated_at']:
+            cache_file(file_data)
+        SYNC_STATE['cursor'] = max(SYNC_STATE['cursor'], file_data['updated_at'])
+
+async def sync_loop():
+    """Pick up other instances' additions/deletions and keep the local snapshot fresh."""
+    loop = asyncio.get_running_loop()
+    last_snapshot = time.time()
+    while True:
+        await asyncio.sleep(SYNC_INTERVAL)
+        try: apply_delta(*await FIREBASE.delta(SYNC_STATE['cursor']))
+        except Exception as e: logger.error(f"Delta Sync Error: {e}")
+        if SYNC_STATE['dirty'] and time.time() - last_snapshot >= SNAPSHOT_INTERVAL:
+            last_snapshot = time.time()
+            SYNC_STATE['dirty'] = False
+            await loop.run_in_executor(None, write_snapshot, *snapshot_rows())
+
+def track_title(title, delta):
+    """Adjust a title's file count, inserting/removing it in MOVIE_TITLES_CACHE on 0 <-> 1."""
+    if not title: return
+    count = TITLE_COUNTS.get(title, 0) + delta
+    if count > 0:
+        if title not in TITLE_COUNTS:
+            bisect.insort(MOVIE_TITLES_CACHE, title)
+            if TITLE_MATCHER: TITLE_MATCHER.add(title)
+        TITLE_COUNTS[title] = count
+    elif TITLE_COUNTS.pop(title, None) is not None:
+        i = bisect.bisect_left(MOVIE_TITLES_CACHE, title)
+        if i < len(MOVIE_TITLES_CACHE) and MOVIE_TITLES_CACHE[i] == title: del MOVIE_TITLES_CACHE[i]
+        if TITLE_MATCHER: TITLE_MATCHER.remove(title)
+
+def cache_file(file_data, norm=None):
+    norm = norm or normalize_file(file_data)
+    if file_data['unique_id'] in FILE_STORE: uncache_file(file_data['unique_id'])
+    SEARCH_INDEX.add(FILE_STORE.add(file_data, norm))
+    track_title(norm.title, 1)
+    note_corpus_change()
+    if SEARCH_POOL: SEARCH_POOL.broadcast(("add", file_data, norm))
+
+def uncache_file(unique_id):
+    row = FILE_STORE.row(unique_id)
+    if row is None: return
+    norm = FILE_STORE.norms[row]
+    SEARCH_INDEX.remove(row)
+    FILE_STORE.remove(unique_id)
+    track_title(norm.title, -1)
+    note_corpus_change()
+    if SEARCH_POOL: SEARCH_POOL.broadcast(("remove", unique_id))
+
+def note_corpus_change():
+    now = time.time()
+    CORPUS_CHANGES['interval'] = 0.8 * CORPUS_CHANGES['interval'] + 0.2 * (now - CORPUS_CHANGES['at'])
+    CORPUS_CHANGES['at'] = now
+    QUERY_CACHE.clear()
+    SYNC_STATE['dirty'] = True
+
+# Search fields of one file; the lowercased raw name is read from FILE_STORE.names instead
+Norm = namedtuple("Norm", "name caption title title_key facets")
+FACET_PAIRS = {}  # (facet, value) -> the one tuple every file shares
+
+def make_norm(name, caption, title, title_key, facets):
+    """A Norm whose repeated strings (titles, facets, a caption equal to the name) are shared."""
+    if caption == name: caption = name
+    if title: title, title_key = sys.intern(title), sys.intern(title_key)
+    return Norm(name, caption, title, title_key, tuple(FACET_PAIRS.setdefault(pair, pair) for pair in map(tuple, facets)))
+
+def normalize_file(file):
+    """Search fields derived from a raw file record, computed once at ingest."""
+    name = file.get('file_name') or ''
+    meta = parse_filename(name)
+    title = meta['title']
+    return make_norm(
+        clean_text(name), clean_text(file.get('caption', '')), title,
+        clean_text(PAREN_YEAR_RE.sub('', title)) if title else "", file_facets(meta)
+    )
+
+# --- Filename Parser ---
+EXTENSION_RE = re.compile(r'\.(mkv|mp4|avi|mov|flv|wmv|webm|m4v|3gp|vob)$', re.IGNORECASE)
+RELEASE_TAG_RE = re.compile(r'[\s\._-]*(720p|1080p|4k|2160p|hd|fullhd|bluray|webdl|webrip|dvdrip|brrip|hdtv|hdcam|camrip|ts|tc|scr|dvdscr|r5|bdrip)[\s\._-]*', re.IGNORECASE)
+CODEC_TAG_RE = re.compile(r'[\s\._-]*(x264|x265|h264|h265|aac|ac3|dd5\.1|dts|hevc)[\s\._-]*', re.IGNORECASE)
+BRACKETS_RE = re.compile(r'\[.*?\]')
+MENTION_RE = re.compile(r'@\w+')
+SEPARATORS_RE = re.compile(r'[._-]+')
+SPACES_RE = re.compile(r'\s+')
+PAREN_YEAR_RE = re.compile(r'\s*\((\d{4})\)')
+TITLE_RES = [
+    re.compile(r'^([A-Za-z0-9\s\.]+?)(?:\s*\(\d{4}\)|\s+\d{4}|\s+season|\s+episode|\s+s\d+e\d+|\s+part|\s+vol\.|\s+cd\d+|$)', re.IGNORECASE),
+    re.compile(r'^([A-Za-z0-9\s\.\-]+?)(?:\s*-\s*\d{4}|$)', re.IGNORECASE),
+]
+# Every facet in one alternation, bounded by non-alphanumerics so "ts" in "knights" is no tag
+FACET_RE = re.compile(r'''(?<![a-z0-9])(?:
+    (?P<quality>2160p|1080p|720p|576p|480p|360p|4k|uhd)
+  | (?P<codec>[xh]\.?26[45]|hevc|avc|xvid|av1)
+  | (?P<se>s(?P<season>\d{1,2})[\s._-]?e(?P<episode>\d{1,3}))
+  | (?P<nxn>(?P<season_x>\d{1,2})x(?P<episode_x>\d{2,3}))
+  | s(?P<season_only>\d{1,2})
+  | season[\s._-]?(?P<season_word>\d{1,2})
+  | (?:episode|ep)[\s._-]?(?P<episode_word>\d{1,3})
+  | (?P<year>(?:19|20)\d{2})
+  | (?P<language>english|eng|hindi|hin|tamil|tam|telugu|tel|malayalam|mal|kannada|kan|bengali|marathi|punjabi
+      |sinhala|korean|japanese|chinese|french|spanish|german|italian|russian|dual|multi)
+)(?![a-z0-9])''', re.VERBOSE)
+FACET_ALIASES = {
+    "4k": "2160p", "uhd": "2160p", "h264": "x264", "h.264": "x264", "avc": "x264",
+    "h265": "x265", "h.265": "x265", "hevc": "x265", "x.264": "x264", "x.265": "x265",
+    "eng": "english", "hin": "hindi", "tam": "tamil", "tel": "telugu", "mal": "malayalam", "kan": "kannada",
+}
+FILTER_FACETS = ("quality", "codec", "season", "episode", "language")  # the year only boosts ranking
+
+def scan_facets(text):
+    """(facet, value) pairs found in `text`, with the (start, end) span of each."""
+    found = []
+    for m in FACET_RE.finditer(text.lower()):
+        kind = m.lastgroup
+        if kind in ("se", "nxn"):
+            season, episode = m.group("season", "episode") if kind == "se" else m.group("season_x", "episode_x")
+            found.append((("season", int(season)), m.span()))
+            found.append((("episode", int(episode)), m.span()))
+        elif kind in ("season_only", "season_word"): found.append((("season", int(m.group(kind))), m.span()))
+        elif kind == "episode_word": found.append((("episode", int(m.group(kind))), m.span()))
+        elif kind == "year": found.append((("year", int(m.group(kind))), m.span()))
+        else:
+            value = m.group(kind)
+            found.append(((kind, FACET_ALIASES.get(value, value)), m.span()))
+    return found
+
+def parse_filename(text):
+    """Title plus release facets: year, quality, codec, season, episode and languages."""
+    meta = {"title": None, "year": None, "quality": None, "codec": None, "season": None, "episode": None, "languages": []}
+    if not text: return meta
+    for (facet, value), _ in scan_facets(text):
+        if facet == "language":
+            if value not in meta["languages"]: meta["languages"].append(value)
+        elif facet == "year": meta["year"] = value  # the last year wins, titles can contain one
+        elif meta[facet] is None: meta[facet] = value
+    meta["title"], year = parse_title(text)
+    if year: meta["year"] = int(year)
+    return meta
+
+def parse_title(text):
+    """(Display title, year in parentheses)."""
+    text = EXTENSION_RE.sub('', text)
+    text = RELEASE_TAG_RE.sub(' ', text)
+    text = CODEC_TAG_RE.sub(' ', text)
+    text = BRACKETS_RE.sub('', text)
+    text = MENTION_RE.sub('', text)
+    text = SEPARATORS_RE.sub(' ', text)
+    text = SPACES_RE.sub(' ', text).strip()
+    year_match = PAREN_YEAR_RE.search(text)
     year = year_match.group(1) if year_match else None
-    text_without_year = re.sub(r'\s*\(\d{4}\)', '', text).strip()
-    patterns = [
-        r'^([A-Za-z0-9\s\.]+?)(?:\s*\(\d{4}\)|\s+\d{4}|\s+season|\s+episode|\s+s\d+e\d+|\s+part|\s+vol\.|\s+cd\d+|$)',
-        r'^([A-Za-z0-9\s\.\-]+?)(?:\s*-\s*\d{4}|$)',
-    ]
-    for pattern in patterns:
-        match = re.match(pattern, text_without_year, re.IGNORECASE)
+    text_without_year = PAREN_YEAR_RE.sub('', text).strip()
+    for pattern in TITLE_RES:
+        match = pattern.match(text_without_year)
         if match:
             title = match.group(1).strip()
-            title = re.sub(r'\.', ' ', title)
-            title = re.sub(r'\s+', ' ', title).strip()
+            title = title.replace('.', ' ')
+            title = SPACES_RE.sub(' ', title).strip()
             if year and title: title = f"{title} ({year})"
-            if title and len(title) > 2 and len(title.split()) <= 10: return title.title()
-    return None
+            if title and len(title) > 2 and len(title.split()) <= 10: return title.title(), year
+    return None, year
 
-def add_file_to_db(file_data):
-    for f in FILES_CACHE:
-        if f['unique_id'] == file_data['unique_id']: return False
+def extract_proper_movie_title(text):
+    if not text: return None
+    return parse_title(text)[0]
+
+async def add_file_to_db(file_data):
+    if file_data['unique_id'] in FILE_STORE: return False
+    file_data['updated_at'] = now_ms()
     try:
-        ref = db.reference(f'files/{file_data["unique_id"]}')
-        ref.set(file_data)
-        FILES_CACHE.append(file_data)
-        global MOVIE_TITLES_CACHE
-        MOVIE_TITLES_CACHE = extract_movie_titles_from_files()
+        await FIREBASE.set(f'files/{file_data["unique_id"]}', file_data)
+        cache_file(file_data)
         return True
     except: return False
 
-def delete_file_from_db(unique_id):
-    global FILES_CACHE, MOVIE_TITLES_CACHE
+async def add_files_batch_to_db(files):
+    """One multi-path update for many files; the caller caches them once it succeeds."""
+    updated_at = now_ms()
+    for f in files: f['updated_at'] = updated_at
+    await FIREBASE.update('files', {f['unique_id']: f for f in files})
+
+async def delete_file_from_db(unique_id):
     try:
-        db.reference(f'files/{unique_id}').delete()
-        FILES_CACHE = [f for f in FILES_CACHE if f['unique_id'] != unique_id]
-        MOVIE_TITLES_CACHE = extract_movie_titles_from_files()
+        # The tombstone lets other instances drop it on their next delta sync
+        await FIREBASE.update('/', {f'files/{unique_id}': None, f'deleted_files/{unique_id}': now_ms()})
+        uncache_file(unique_id)
         return True
     except: return False
 
 def get_file_by_id(unique_id):
-    for file in FILES_CACHE:
-        if file['unique_id'] == unique_id: return file
-    return None
+    return FILE_STORE.get(unique_id)
 
-def add_user(user_id):
-    if user_id < 0: return
+def load_users():
+    global USER_IDS
     try:
-        ref = db.reference(f'users/{user_id}')
-        if not ref.get(): ref.set({"active": True})
-    except: pass
+        snap = db.reference('users').get(shallow=True)
+        USER_IDS = {int(uid) for uid in snap} if snap else set()
+        logger.info(f"👤 Users Loaded: {len(USER_IDS)}")
+    except Exception as e: logger.error(f"Users Load Error: {e}")
 
-def get_all_users():
-    try:
-        snap = db.reference('users').get()
-        return list(snap.keys()) if snap else []
-    except: return []
+def add_user(user_id):
+    if user_id < 0 or user_id in USER_IDS: return
+    USER_IDS.add(user_id)
+    FIREBASE.write_behind(f'users/{user_id}', {"active": True})
+
+def remove_user(user_id):
+    USER_IDS.discard(user_id)
+    FIREBASE.write_behind(f'users/{user_id}', None)
 
 # --- Helpers ---
 def get_size(size):
@@ -184,25 +695,400 @@ def clean_text(text):
     if not text: return ""
     return re.sub(r'[\W_]+', ' ', text).lower().strip()
 
+def file_tokens(norm):
+    tokens = set(norm.name.split())
+    tokens.update(norm.caption.split())
+    tokens.update(clean_text(norm.title).split())
+    return tokens
+
+def file_facets(meta):
+    """(facet, value) pairs of a parse_filename() result."""
+    facets = {(facet, meta[facet]) for facet in ("quality", "codec", "season", "episode") if meta[facet] is not None}
+    facets.update(("language", lang) for lang in meta['languages'])
+    return facets
+
+def split_query(query):
+    """(query text, filter facets): tokens like `1080p` or `S02E05` become filters."""
+    facets, text, last = set(), [], 0
+    for (facet, value), (start, end) in scan_facets(query):
+        if facet not in FILTER_FACETS: continue
+        facets.add((facet, value))
+        text.append(query[last:start])
+        last = end
+    text.append(query[last:])
+    return " ".join("".join(text).split()), facets
+
+def match_file(row, clean_query, raw_query, use_caption=True, use_title=True):
+    """The search match rules, run against a file's precomputed fields."""
+    norm = FILE_STORE.norms[row]
+    if clean_query in norm.name: return True
+    if use_caption and clean_query in norm.caption: return True
+    if raw_query:
+        raw_name = FILE_STORE.names[row].lower()
+        if all(w in raw_name for w in raw_query): return True
+    return use_title and bool(norm.title) and clean_query in norm.title.lower()
+
 def get_system_stats():
     process = psutil.Process(os.getpid())
     return get_size(process.memory_info().rss)
 
 # --- Auto Delete ---
+class DeleteScheduler:
+    """Auto-delete queue kept as a min-heap in RAM.
+
+    Firebase `delete_queue` is only a backup: it is read once at startup and
+    written behind through FIREBASE.write_behind(), so restarts lose nothing.
+    """
+    MAX_SLEEP = 60
+    BATCH = 100  # Telegram's limit for one delete_messages call
+
+    def __init__(self):
+        self.heap = []  # (delete_time, chat_id, message_id)
+        self.wakeup = asyncio.Event()
+
+    def load(self):
+        try:
+            snap = db.reference('delete_queue').get() or {}
+            for v in snap.values(): self.heap.append((v['delete_time'], v['chat_id'], v['message_id']))
+            heapq.heapify(self.heap)
+            logger.info(f"🗑️ Delete Queue Loaded: {len(self.heap)} tasks")
+        except Exception as e: logger.error(f"Delete Queue Load Error: {e}")
+
+    def add(self, chat_id, message_id, delete_time):
+        task = (delete_time, chat_id, message_id)
+        heapq.heappush(self.heap, task)
+        FIREBASE.write_behind(
+            f"delete_queue/{chat_id}_{message_id}",
+            {"chat_id": chat_id, "message_id": message_id, "delete_time": delete_time}
+        )
+        if self.heap[0] is task: self.wakeup.set()
+
+    def cancel(self, chat_id, message_id):
+        """Keep a message that was scheduled for deletion."""
+        kept = [task for task in self.heap if task[1:] != (chat_id, message_id)]
+        if len(kept) == len(self.heap): return
+        self.heap = kept
+        heapq.heapify(self.heap)
+        FIREBASE.write_behind(f"delete_queue/{chat_id}_{message_id}", None)
+
+    def pop_due(self, now):
+        """Due message ids grouped per chat."""
+        due = {}
+        while self.heap and self.heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self.heap)
+            due.setdefault(chat_id, []).append(message_id)
+            FIREBASE.write_behind(f"delete_queue/{chat_id}_{message_id}", None)
+        return due
+
+    async def run(self, client):
+        while True:
+            try:
+                for chat_id, ids in self.pop_due(time.time()).items():
+                    for i in range(0, len(ids), self.BATCH):
+                        try: await client.delete_messages(chat_id, ids[i:i + self.BATCH])
+                        except FloodWait as e:
+                            # Requeue (and re-persist) this batch and the chat's remaining ones for later
+                            logger.warning(f"Delete FloodWait: {e.value}s")
+                            retry_at = time.time() + e.value + 1
+                            for message_id in ids[i:]: self.add(chat_id, message_id, retry_at)
+                            break
+                        except: pass
+            except Exception as e: logger.error(f"Delete Scheduler Error: {e}")
+            timeout = self.MAX_SLEEP
+            if self.heap: timeout = min(timeout, self.heap[0][0] - time.time())
+            self.wakeup.clear()
+            try: await asyncio.wait_for(self.wakeup.wait(), max(timeout, 0))
+            except asyncio.TimeoutError: pass
+
+DELETE_SCHEDULER = DeleteScheduler()
+
 def add_delete_task(chat_id, message_id, delete_time):
-    try: db.reference(f'delete_queue/{chat_id}_{message_id}').set({"chat_id": chat_id, "message_id": message_id, "delete_time": delete_time})
-    except: pass
+    DELETE_SCHEDULER.add(chat_id, message_id, delete_time)
 
-def get_due_delete_tasks():
-    try:
-        snap = db.reference('delete_queue').get()
-        now = time.time()
-        return [dict(v, key=k) for k, v in snap.items() if v['delete_time'] <= now] if snap else []
-    except: return []
+# ==============================================================================
+# 🗂️ SEARCH INDEX
+# ==============================================================================
+class SearchIndex:
+    """Inverted index: token -> FILE_STORE rows of files whose name, caption or title contain it.
 
-def remove_delete_task(key):
-    try: db.reference(f'delete_queue/{key}').delete()
-    except: pass
+    Every match rule is a substring test, so each word of a query must sit inside
+    some token of a matching file. Candidates are the files covering all query
+    words; callers still run the exact match rules on them.
+    """
+    GRAM = 3
+    VERIFY_LIMIT = 64  # stop intersecting once this few candidates remain
+
+    def __init__(self):
+        self.postings = {}  # token -> set(row)
+        self.docs = {}      # row -> (tokens, name + caption length, facets), tuples shared with postings/norms
+        self.facets = {}    # (facet, value) -> set(row), see parse_filename()
+        self.grams = {}     # trigram -> set(token), substring lookups on the vocabulary
+        self.total_length = 0  # BM25 average document length
+        self.version = 0       # bumped on every change; match sets from older versions are stale
+
+    def _grams(self, token):
+        return {token[i:i + self.GRAM] for i in range(len(token) - self.GRAM + 1)}
+
+    def rebuild(self, rows):
+        version = self.version
+        self.__init__()
+        self.version = version + 1
+        for row in rows: self.add(row)
+
+    def add(self, row):
+        self.remove(row)
+        norm = FILE_STORE.norms[row]
+        tokens = tuple(map(sys.intern, file_tokens(norm)))
+        length = len(norm.name.split()) + len(norm.caption.split())
+        facets = norm.facets
+        self.docs[row] = (tokens, length, facets)
+        self.version += 1
+        self.total_length += length
+        for facet in facets: self.facets.setdefault(facet, set()).add(row)
+        for token in tokens:
+            posting = self.postings.get(token)
+            if posting is None:
+                posting = self.postings[token] = set()
+                for g in self._grams(token): self.grams.setdefault(g, set()).add(token)
+            posting.add(row)
+
+    def remove(self, row):
+        doc = self.docs.pop(row, None)
+        if doc is None: return
+        self.version += 1
+        self.total_length -= doc[1]
+        for facet in doc[2]:
+            owners = self.facets[facet]
+            owners.discard(row)
+            if not owners: del self.facets[facet]
+        for token in doc[0]:
+            posting = self.postings[token]
+            posting.discard(row)
+            if posting: continue
+            del self.postings[token]
+            for g in self._grams(token):
+                owners = self.grams[g]
+                owners.discard(token)
+                if not owners: del self.grams[g]
+
+    def expand(self, word):
+        """Vocabulary tokens containing `word`."""
+        if len(word) < self.GRAM:
+            return [t for t in self.postings if word in t]
+        owners = sorted((self.grams.get(g, ()) for g in self._grams(word)), key=len)
+        if not owners[0]: return []
+        return [t for t in owners[0] if word in t]
+
+    def candidates(self, query):
+        """Rows (in insertion order) that may match `query`."""
+        found = None
+        # Longer words expand to fewer tokens, so they prune first
+        for word in sorted(set(clean_text(query).split()), key=len, reverse=True):
+            ids = set()
+            for token in self.expand(word): ids |= self.postings[token]
+            found = ids if found is None else found & ids
+            if len(found) <= self.VERIFY_LIMIT: break
+        if found is None: return list(self.docs)
+        return sorted(found)
+
+    def filter(self, facets):
+        """Rows carrying every (facet, value) pair, smallest set first."""
+        owners = sorted((self.facets.get(facet, set()) for facet in facets), key=len)
+        return owners[0].intersection(*owners[1:])
+
+    def memory_report(self, sample=2000):
+        """Bytes held by the per-file docs (token strings are counted once, as vocabulary)."""
+        docs = [doc for doc in map(self.docs.get, islice(FILE_STORE.live_rows(), sample)) if doc is not None]
+        per_doc = sum(sys.getsizeof(doc) + sys.getsizeof(doc[0]) for doc in docs)
+        total = sys.getsizeof(self.docs) + (per_doc / len(docs) * len(self.docs) if docs else 0)
+        per_file = int(total / len(self.docs)) if self.docs else 0
+        return f"Index docs (est.): {get_size(total)} ({per_file} B/file, {len(self.postings)} tokens)"
+
+SEARCH_INDEX = SearchIndex()
+
+class TitleMatcher:
+    """Fuzzy suggestions over MOVIE_TITLES_CACHE.
+
+    Titles are pre-processed once as they enter the cache. A query only scores
+    the titles sharing the most trigrams with it, and queries arriving in the
+    same loop tick are scored together in one executor job.
+    """
+    CANDIDATES = 300  # titles handed to RapidFuzz per query
+    COMMON = 0.05     # grams in more than this share of titles are skipped when rarer ones exist
+
+    def __init__(self):
+        self.lock = threading.Lock()  # scoring runs on executor threads
+        self.titles = []     # slot -> title, None once freed
+        self.processed = []  # slot -> default_process(title)
+        self.slots = {}      # title -> slot
+        self.free = []
+        self.grams = {}      # trigram -> set(slot)
+        self.pending = []    # (query, future) waiting for the next batch
+
+    def _grams(self, text):
+        text = f" {text} "
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def rebuild(self, titles):
+        with self.lock:
+            self.titles, self.processed, self.slots, self.free, self.grams = [], [], {}, [], {}
+            for title in titles: self._add(title)
+
+    def add(self, title):
+        with self.lock: self._add(title)
+
+    def _add(self, title):
+        if title in self.slots: return
+        processed = utils.default_process(title)
+        if self.free:
+            slot = self.free.pop()
+            self.titles[slot], self.processed[slot] = title, processed
+        else:
+            slot = len(self.titles)
+            self.titles.append(title)
+            self.processed.append(processed)
+        self.slots[title] = slot
+        for g in self._grams(processed): self.grams.setdefault(g, set()).add(slot)
+
+    def remove(self, title):
+        with self.lock:
+            slot = self.slots.pop(title, None)
+            if slot is None: return
+            for g in self._grams(self.processed[slot]):
+                owners = self.grams[g]
+                owners.discard(slot)
+                if not owners: del self.grams[g]
+            self.titles[slot] = self.processed[slot] = None
+            self.free.append(slot)
+
+    def match(self, query, limit=5, score_cutoff=40):
+        query = utils.default_process(query)
+        with self.lock:
+            postings = sorted((self.grams[g] for g in self._grams(query) if g in self.grams), key=len)
+            if not postings: return []
+            common = max(1, int(len(self.slots) * self.COMMON))
+            postings = [p for p in postings if len(p) <= common] or postings[:1]
+            overlap = Counter()
+            for p in postings: overlap.update(p)
+            choices = {slot: self.processed[slot] for slot, _ in overlap.most_common(self.CANDIDATES)}
+            titles = {slot: self.titles[slot] for slot in choices}
+        matches = process.extract(query, choices, scorer=fuzz.WRatio, processor=None, limit=limit, score_cutoff=score_cutoff)
+        return [titles[slot] for _, _, slot in matches]
+
+    async def suggest(self, query):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((query, future))
+        if len(self.pending) == 1: loop.call_soon(self._flush, loop)
+        return await future
+
+    def _flush(self, loop):
+        batch, self.pending = self.pending, []
+        job = loop.run_in_executor(None, lambda: [self.match(query) for query, _ in batch])
+
+        def deliver(job):
+            for i, (_, future) in enumerate(batch):
+                if future.done(): continue
+                if job.exception(): future.set_exception(job.exception())
+                else: future.set_result(job.result()[i])
+        job.add_done_callback(deliver)
+
+TITLE_MATCHER = TitleMatcher() if FUZZY_AVAILABLE else None
+
+# ==============================================================================
+# ⚙️ SEARCH WORKERS
+# ==============================================================================
+class SearchPool:
+    """Searches, inline lookups and fuzzy suggestions on forked worker processes.
+
+    Workers are forked once the startup load is done, so each begins with the
+    whole store and index copy-on-write. gc.freeze() only stops the collector
+    from walking those objects; reference counting still writes to every page
+    a worker reads, so each worker's RSS drifts toward a full copy over time.
+    Every later cache_file() and uncache_file() is replayed on each worker in
+    order, which keeps their row ids identical to ours; only row ids, totals
+    and titles come back.
+    """
+    def __init__(self, size):
+        context = multiprocessing.get_context("fork")
+        self.results = context.Queue()
+        self.queues, self.processes = [], []
+        self.pending = {}  # job id -> (loop, future)
+        self.jobs = 0
+        gc.freeze()
+        for _ in range(size):
+            queue = context.Queue()
+            process = context.Process(target=search_worker, args=(queue, self.results), daemon=True)
+            process.start()
+            self.queues.append(queue)
+            self.processes.append(process)
+        threading.Thread(target=self._collect, daemon=True).start()
+        logger.info(f"⚙️ Search Workers Started: {size}")
+
+    def _collect(self):
+        while True:
+            job, ok, value = self.results.get()
+            entry = self.pending.pop(job, None)
+            if entry: entry[0].call_soon_threadsafe(self._deliver, entry[1], ok, value)
+
+    @staticmethod
+    def _deliver(future, ok, value):
+        if future.done(): return
+        if ok: future.set_result(value)
+        else: future.set_exception(RuntimeError(value))
+
+    async def submit(self, task, worker=None):
+        """Run `task` on `worker` (default: the next one in turn) and await its answer."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.jobs += 1
+        job = self.jobs
+        self.pending[job] = (loop, future)
+        self.queues[job % len(self.queues) if worker is None else worker % len(self.queues)].put((job, *task))
+        try: return await asyncio.wait_for(future, SEARCH_WORKER_TIMEOUT)
+        finally: self.pending.pop(job, None)
+
+    def broadcast(self, task):
+        for queue in self.queues: queue.put((None, *task))
+
+    def dead(self):
+        """Exit codes of workers that are gone."""
+        return [process.exitcode for process in self.processes if not process.is_alive()]
+
+    def close(self):
+        for queue in self.queues: queue.put(None)
+
+    def kill(self):
+        for process in self.processes: process.kill()
+        for queue in self.queues: queue.cancel_join_thread()  # nobody reads them any more
+
+def check_search_pool():
+    """Search in-process from now on if a worker died. Its jobs would only time out, and
+    re-forking from the running (threaded) bot could leave the new worker deadlocked."""
+    global SEARCH_POOL
+    dead = SEARCH_POOL.dead() if SEARCH_POOL else None
+    if not dead: return
+    logger.error(f"Search Workers Disabled: worker exited with {dead}")
+    SEARCH_POOL.kill()
+    SEARCH_POOL = None
+
+def search_worker(queue, results):
+    """Worker process loop: replay file changes, answer lookups."""
+    global SEARCH_POOL
+    SEARCH_POOL = None
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the bot shuts workers down
+    while (task := queue.get()) is not None:
+        job, kind, *args = task
+        try:
+            if kind == "add": value = cache_file(*args)
+            elif kind == "remove": value = uncache_file(*args)
+            elif kind == "search": value = search_files(*args)
+            elif kind == "inline": value = inline_results(*args)
+            elif kind == "suggest": value = TITLE_MATCHER.match(*args) if TITLE_MATCHER else []
+            if job is not None: results.put((job, True, value))
+        except Exception as e:
+            logger.error(f"Search Worker Error: {e}")
+            if job is not None: results.put((job, False, str(e)))
 
 # ==============================================================================
 # 🤖 BOT SETUP
@@ -212,84 +1098,351 @@ app = Client("BSFilterBot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKE
 # Health Check Server
 class HealthHandler(BaseHTTPRequestHandler):
     def do_GET(self):
+        if self.path == "/metrics":
+            body = render_metrics().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
         self.send_response(200)
         self.wfile.write(b"Bot Running")
+
+    def log_message(self, *args):
+        pass  # scrapes every few seconds would flood the log
 def run_http_server():
     server = HTTPServer(('0.0.0.0', PORT), HealthHandler)
     server.serve_forever()
 
+def render_metrics():
+    """Prometheus text exposition of LATENCY plus current gauges and counters."""
+    lines = [
+        "# HELP bot_latency_seconds Handler and Firebase call latency.",
+        "# TYPE bot_latency_seconds histogram",
+    ]
+    for name, histogram in list(LATENCY.items()):
+        counts, cumulative = list(histogram.counts), 0
+        for bound, count in zip(histogram.BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f'bot_latency_seconds_bucket{{op="{name}",le="{bound}"}} {cumulative}')
+        lines.append(f'bot_latency_seconds_sum{{op="{name}"}} {histogram.sum}')
+        lines.append(f'bot_latency_seconds_count{{op="{name}"}} {cumulative}')
+
+    heap = DELETE_SCHEDULER.heap
+    try: delete_lag = max(0.0, time.time() - heap[0][0])
+    except IndexError: delete_lag = 0.0
+    gauges = (
+        ("bot_files", "Files in the file store.", len(FILE_STORE)),
+        ("bot_search_data_cache_size", "Paged searches held for callbacks.", len(SEARCH_DATA_CACHE)),
+        ("bot_suggestion_cache_size", "Suggestion buttons held for callbacks.", len(SUGGESTION_CACHE)),
+        ("bot_query_cache_size", "Cached search results.", len(QUERY_CACHE)),
+        ("bot_users", "Registered users.", len(USER_IDS)),
+        ("bot_index_jobs", "Running index jobs.", len(INDEX_JOBS)),
+        ("bot_delete_queue_depth", "Messages waiting for auto-delete.", len(heap)),
+        ("bot_delete_queue_lag_seconds", "How overdue the oldest pending auto-delete is.", delete_lag),
+        ("bot_event_loop_lag_seconds", "Latest event loop wake-up delay.", LOOP_LAG["last"]),
+        ("bot_event_loop_lag_max_seconds", "Worst event loop wake-up delay since start.", LOOP_LAG["max"]),
+        ("bot_imdb_busy", "IMDb lookups in progress.", IMDB_STATS["busy"]),
+        ("bot_rss_bytes", "Resident memory.", psutil.Process(os.getpid()).memory_info().rss),
+    )
+    for name, help_text, value in gauges:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+    counters = (
+        ("bot_imdb_cache_hits_total", "IMDb answers served from cache.", IMDB_CACHE.hits),
+        ("bot_imdb_lookups_total", "IMDb lookups started.", IMDB_STATS["lookups"]),
+        ("bot_imdb_timeouts_total", "IMDb lookups that fell back to fuzzy suggestions.", IMDB_STATS["timeouts"]),
+        ("bot_imdb_errors_total", "IMDb lookups that failed.", IMDB_STATS["errors"]),
+    )
+    for name, help_text, value in counters:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+async def loop_lag_monitor(interval=1):
+    """A sleeper that wakes late means something blocked the loop."""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG["last"] = lag = max(0.0, time.perf_counter() - start - interval)
+        LOOP_LAG["max"] = max(LOOP_LAG["max"], lag)
+
 # Background Loop
 async def background_tasks():
-    while True:
-        try:
-            tasks = get_due_delete_tasks()
-            for task in tasks:
-                try: await app.delete_messages(task['chat_id'], task['message_id'])
-                except: pass
-                remove_delete_task(task['key'])
-        except: pass
-        await asyncio.sleep(10)
+    await asyncio.gather(DELETE_SCHEDULER.run(app), imdb_cache_saver(), sync_loop(), loop_lag_monitor())
 
 # ==============================================================================
 # 🔍 SEARCH ENGINES
 # ==============================================================================
+def imdb_search(query):
+    suggestions = []
+    for m in ia.search_movie(query)[:5]:
+        title = m.get('title')
+        year = m.get('year')
+        if title:
+            full_name = f"{title} ({year})" if year else title
+            if full_name not in suggestions: suggestions.append(full_name)
+    return suggestions
+
+def load_imdb_cache():
+    try:
+        with open(IMDB_CACHE_FILE) as f: saved = json.load(f)
+        now = time.time()
+        for cache, name in ((IMDB_CACHE, "hits"), (IMDB_MISSES, "misses")):
+            for key, expires, value in saved.get(name, []):
+                if expires > now: cache.data[key] = (expires, value)
+        logger.info(f"🎬 IMDb Cache Loaded: {len(IMDB_CACHE)} hits, {len(IMDB_MISSES)} misses")
+    except FileNotFoundError: pass
+    except Exception as e: logger.error(f"IMDb Cache Load Error: {e}")
+
+def imdb_cache_rows():
+    """Snapshot both IMDb caches; call on the loop thread, which owns them."""
+    return {
+        name: [[key, expires, value] for key, (expires, value) in cache.data.items()]
+        for cache, name in ((IMDB_CACHE, "hits"), (IMDB_MISSES, "misses"))
+    }
+
+def save_imdb_cache(saved=None):
+    if saved is None: saved = imdb_cache_rows()
+    try:
+        with open(IMDB_CACHE_FILE + ".tmp", "w") as f: json.dump(saved, f)
+        os.replace(IMDB_CACHE_FILE + ".tmp", IMDB_CACHE_FILE)
+    except Exception as e: logger.error(f"IMDb Cache Save Error: {e}")
+
+async def imdb_cache_saver():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(IMDB_SAVE_INTERVAL)
+        if IMDB_STATS["unsaved"]:
+            IMDB_STATS["unsaved"] = 0
+            await loop.run_in_executor(None, save_imdb_cache, imdb_cache_rows())
+
+def imdb_lookup_done(key, future):
+    IMDB_STATS["busy"] -= 1
+    if future.cancelled() or future.exception(): return
+    # Late results (after a timeout) are still worth caching
+    if future.result(): IMDB_CACHE[key] = future.result()
+    else: IMDB_MISSES[key] = True
+    IMDB_STATS["unsaved"] += 1
+
+async def get_imdb_suggestions(query):
+    """IMDb titles for `query`, or None when IMDb is busy, slow or failing."""
+    key = clean_text(query)
+    cached = IMDB_CACHE.get(key)
+    if cached is not None: return cached
+    if IMDB_MISSES.get(key): return []
+    if IMDB_STATS["busy"] >= IMDB_WORKERS: return None
+    IMDB_STATS["busy"] += 1
+    IMDB_STATS["lookups"] += 1
+    future = asyncio.wrap_future(IMDB_EXECUTOR.submit(imdb_search, query))
+    future.add_done_callback(lambda f: imdb_lookup_done(key, f))
+    try:
+        return await asyncio.wait_for(asyncio.shield(future), IMDB_TIMEOUT)
+    except asyncio.TimeoutError:
+        IMDB_STATS["timeouts"] += 1
+        logger.warning(f"IMDb Timeout: {query}")
+    except Exception as e:
+        IMDB_STATS["errors"] += 1
+        logger.error(f"IMDb Error: {e}")
+    return None
+
 async def get_smart_suggestions(query):
     suggestions = []
     # 1. IMDb
     if IMDB_AVAILABLE:
-        try:
-            loop = asyncio.get_running_loop()
-            movies = await loop.run_in_executor(None, ia.search_movie, query)
-            for m in movies[:5]:
-                title = m.get('title')
-                year = m.get('year')
-                if title:
-                    full_name = f"{title} ({year})" if year else title
-                    if full_name not in suggestions: suggestions.append(full_name)
-        except Exception as e: logger.error(f"IMDb Error: {e}")
+        suggestions = list(await get_imdb_suggestions(query) or [])
     
-    # 2. Internal Fuzzy
+    # 2. Internal Fuzzy (also the fallback when IMDb is busy or times out)
     if not suggestions and FUZZY_AVAILABLE and MOVIE_TITLES_CACHE:
-        matches = process.extract(query, MOVIE_TITLES_CACHE, scorer=fuzz.WRatio, limit=5, score_cutoff=40)
-        for m in matches:
-            if m[0] not in suggestions: suggestions.append(m[0])
+        try:
+            for title in await fuzzy_suggestions(query):
+                if title not in suggestions: suggestions.append(title)
+        except Exception as e: logger.error(f"Fuzzy Error: {e}")
     return suggestions
 
+def query_cache_key(query):
+    """clean_text() form of a query. Raw words only change the match when they carry punctuation."""
+    clean_query = clean_text(query)
+    raw_query = query.lower().split()
+    if raw_query == clean_query.split(): return clean_query
+    return f"{clean_query}|{' '.join(raw_query)}"
+
+async def single_flight(key, factory):
+    """Run factory() once per key at a time; concurrent callers await the same result."""
+    task = IN_FLIGHT.get(key)
+    if task is None:
+        task = IN_FLIGHT[key] = asyncio.ensure_future(factory())
+        task.add_done_callback(lambda _: IN_FLIGHT.pop(key, None))
+    return await asyncio.shield(task)
+
+def rank_files(query, rows, limit=MAX_RESULTS):
+    """Top `limit` files by BM25 over name/caption tokens, boosted for an exact title or year match."""
+    clean_query = clean_text(query)
+    n = max(len(SEARCH_INDEX.docs), 1)
+    avg_length = SEARCH_INDEX.total_length / n or 1
+    idf = {}
+    for term in set(clean_query.split()):
+        df = len(SEARCH_INDEX.postings.get(term, ()))
+        idf[f" {term} "] = math.log(1 + (n - df + 0.5) / (df + 0.5))
+    years = YEAR_RE.findall(clean_query)
+    title_keys = {clean_query, YEAR_RE.sub('', clean_query).strip()} - {""}
+    norm_k = BM25_K1 * (1 - BM25_B)
+    length_k = BM25_K1 * BM25_B / avg_length
+
+    norms, names, docs = FILE_STORE.norms, FILE_STORE.names, SEARCH_INDEX.docs
+
+    def score(row):
+        norm = norms[row]
+        length = docs[row][1]
+        text = f" {norm.name} {norm.caption} "
+        total = 0.0
+        for term, weight in idf.items():
+            tf = text.count(term)
+            if tf: total += weight * tf * (BM25_K1 + 1) / (tf + norm_k + length_k * length)
+        if norm.title_key in title_keys: total += TITLE_BOOST
+        if years and any(y in names[row] for y in years): total += YEAR_BOOST
+        return total, -row  # ties keep insertion order
+    return heapq.nlargest(limit, rows, key=score)
+
+def search_files(query):
+    """(best MAX_RESULTS rows, total matches) for `query`, cached until the file store changes."""
+    key = query_cache_key(query)
+    results = QUERY_CACHE.get(key)
+    if results is not None: return results
+    text, facets = split_query(query)
+    allowed = SEARCH_INDEX.filter(facets) if facets else None
+    if text:
+        clean_query = clean_text(text)
+        raw_query = text.lower().split()
+        # Narrow filters are cheaper to verify directly than to intersect with the text candidates
+        if allowed is not None and len(allowed) <= SEARCH_INDEX.VERIFY_LIMIT: pool = allowed
+        else: pool = SEARCH_INDEX.candidates(text)
+        matches = [
+            row for row in pool
+            if (allowed is None or row in allowed) and match_file(row, clean_query, raw_query)
+        ]
+    else: matches = list(allowed or ())
+    results = QUERY_CACHE[key] = (tuple(rank_files(text, matches)), len(matches))
+    return results
+
+def inline_matches(user_id, text):
+    """Files matching `text` by inline rules. A query extending the user's previous one
+    can only match a subset of its files, so that set is re-checked instead of the index."""
+    query = text.lower()
+    session = INLINE_SESSIONS.get(user_id)
+    if session and session[1] == SEARCH_INDEX.version and query.startswith(session[0]): pool = session[2]
+    else: pool = SEARCH_INDEX.candidates(text)
+    clean_query, raw_query = clean_text(text), query.split()
+    matches = [row for row in pool if match_file(row, clean_query, raw_query, use_caption=False, use_title=False)]
+    if len(matches) <= INLINE_SESSION_MAX: INLINE_SESSIONS[user_id] = (query, SEARCH_INDEX.version, array('i', matches))
+    else: INLINE_SESSIONS.data.pop(user_id, None)
+    return matches
+
+def inline_results(user_id, text):
+    """Ranked inline results, cached so scrolling (next_offset) only slices."""
+    key = ("inline", query_cache_key(text))
+    results = QUERY_CACHE.get(key)
+    if results is None: results = QUERY_CACHE[key] = tuple(rank_files(text, inline_matches(user_id, text), INLINE_MAX_RESULTS))
+    return results
+
+def inline_cache_time():
+    """Half the typical gap between file changes, so Telegram's cache rarely hides a new file."""
+    gap = max(CORPUS_CHANGES['interval'], time.time() - CORPUS_CHANGES['at'])
+    return int(min(max(gap / 2, INLINE_CACHE_MIN), INLINE_CACHE_MAX))
+
+async def search(query):
+    """search_files(), on a worker process when SEARCH_WORKERS is set."""
+    check_search_pool()
+    if not SEARCH_POOL: return search_files(query)
+    key = query_cache_key(query)
+    results = QUERY_CACHE.get(key)
+    if results is not None: return results
+
+    async def compute():
+        version = SEARCH_INDEX.version
+        try: results = await SEARCH_POOL.submit(("search", query))
+        except Exception as e:
+            logger.error(f"Search Worker Error: {e}")
+            return search_files(query)
+        # Files changed meanwhile: the answer is still valid for now, just not worth caching
+        if SEARCH_INDEX.version == version: QUERY_CACHE[key] = results
+        return results
+    return await single_flight(("search", key), compute)
+
+async def inline_lookup(user_id, text):
+    """inline_results(); with workers, a user always lands on the same one so its session narrows."""
+    check_search_pool()
+    if not SEARCH_POOL: return inline_results(user_id, text)
+    key = ("inline", query_cache_key(text))
+    results = QUERY_CACHE.get(key)
+    if results is not None: return results
+
+    async def compute():
+        version = SEARCH_INDEX.version
+        try: results = await SEARCH_POOL.submit(("inline", user_id, text), worker=user_id)
+        except Exception as e:
+            logger.error(f"Search Worker Error: {e}")
+            return inline_results(user_id, text)
+        if SEARCH_INDEX.version == version: QUERY_CACHE[key] = results
+        return results
+    # Identical concurrent texts share one lookup, on the first asker's worker
+    return await single_flight(key, compute)
+
+async def fuzzy_suggestions(query):
+    check_search_pool()
+    if SEARCH_POOL:
+        try: return await SEARCH_POOL.submit(("suggest", query))
+        except Exception as e: logger.error(f"Search Worker Error: {e}")
+    return await TITLE_MATCHER.suggest(query)
+
+def group_by_title(rows):
+    """[(title, rows)] in rank order of each title's best file, over the ranked rows only."""
+    groups = {}
+    for row in rows: groups.setdefault(FILE_STORE.norms[row].title or "Other Files", []).append(row)
+    return list(groups.items())
+
+BM25_K1, BM25_B = 1.2, 0.75
+TITLE_BOOST = 5.0
+YEAR_BOOST = 2.0
+YEAR_RE = re.compile(r'\b(?:19|20)\d{2}\b')
+
+async def get_query_suggestions(query):
+    key = query_cache_key(query)
+    suggestions = QUERY_SUGGESTIONS.get(key)
+    if suggestions is not None: return suggestions
+
+    async def compute():
+        QUERY_SUGGESTIONS[key] = result = await get_smart_suggestions(query)
+        return result
+    return await single_flight(("suggest", key), compute)
+
+@timed("perform_search")
 async def perform_search(client, message, query, is_correction=False):
     if not query or len(query) < 2: return await message.reply_text("❌ Query too short.")
     
     if not is_correction:
         add_delete_task(message.chat.id, message.id, time.time() + USER_MSG_DELETE_TIME)
 
-    clean_query = clean_text(query)
-    raw_query = query.lower().split()
-    results = []
-
     # Search Internal
-    for file in FILES_CACHE:
-        fname = clean_text(file.get('file_name', ''))
-        capt = clean_text(file.get('caption', ''))
-        extracted = extract_proper_movie_title(file.get('file_name', ''))
-        
-        if clean_query in fname or clean_query in capt:
-            results.append(file)
-            continue
-        if raw_query and all(w in file.get('file_name', '').lower() for w in raw_query):
-            results.append(file)
-            continue
-        if extracted and clean_query in extracted.lower():
-            results.append(file)
+    results = await search(query)
 
     # FOUND
-    if results:
+    ids, total = results
+    if total:
         search_id = str(uuid.uuid4())[:8]
-        SEARCH_DATA_CACHE[search_id] = results
-        await send_results_page(message, search_id, page=1, is_edit=is_correction)
+        groups = group_by_title(ids)
+        # Big franchises list their titles first instead of pages of near-identical files
+        if len(groups) > 1 and len(ids) > RESULTS_PER_PAGE:
+            SEARCH_DATA_CACHE[search_id] = {"groups": groups, "total": total}
+            await send_groups_page(message, search_id, page=1, is_edit=is_correction)
+        else:
+            SEARCH_DATA_CACHE[search_id] = {"ids": ids, "total": total}
+            await send_results_page(message, search_id, page=1, is_edit=is_correction)
         return
 
     # NOT FOUND -> SUGGEST
     if is_correction: await message.edit_text(f"🔎 Checking Suggestions for '{query}'...")
-    suggestions = await get_smart_suggestions(query)
+    suggestions = await get_query_suggestions(query)
 
     if suggestions:
         buttons = []
@@ -315,13 +1468,13 @@ async def perform_search(client, message, query, is_correction=False):
             add_delete_task(sent.chat.id, sent.id, time.time() + SUGGESTION_DELETE_TIME)
 
 async def send_results_page(message, search_id, page=1, is_edit=False):
-    results = SEARCH_DATA_CACHE.get(search_id)
-    if not results: return await message.edit_text("⚠️ Search expired.") if is_edit else None
+    entry = SEARCH_DATA_CACHE.get(search_id)
+    if not entry: return await message.edit_text("⚠️ Search expired.") if is_edit else None
     
-    total = len(results)
-    total_pages = math.ceil(total / RESULTS_PER_PAGE)
+    results, total = entry["ids"], entry["total"]
+    total_pages = math.ceil(len(results) / RESULTS_PER_PAGE)
     start = (page - 1) * RESULTS_PER_PAGE
-    current = results[start:start + RESULTS_PER_PAGE]
+    current = [f for row in results[start:start + RESULTS_PER_PAGE] if (f := FILE_STORE.file(row))]
     
     buttons = []
     for file in current:
@@ -338,14 +1491,54 @@ async def send_results_page(message, search_id, page=1, is_edit=False):
     nav.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
     if page < total_pages: nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"page|{search_id}|{page+1}"))
     if nav: buttons.append(nav)
+    if entry.get("parent"): buttons.append([InlineKeyboardButton("⬅️ All Titles", callback_data=f"gpage|{entry['parent']}|1")])
     buttons.append([InlineKeyboardButton("❌ Close", callback_data="close_data")])
     
-    text = f"🔍 **Found {total} files**\n📄 Page {page}/{total_pages}"
+    shown = f" (best {len(results)})" if total > len(results) else ""
+    text = f"🔍 **Found {total} files**{shown}\n📄 Page {page}/{total_pages}"
     if is_edit: await message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
     else: 
         sent = await message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
         add_delete_task(sent.chat.id, sent.id, time.time() + RESULT_MSG_DELETE_TIME)
 
+async def send_groups_page(message, search_id, page=1, is_edit=False):
+    entry = SEARCH_DATA_CACHE.get(search_id)
+    if not entry: return await message.edit_text("⚠️ Search expired.") if is_edit else None
+
+    groups = entry["groups"]
+    total_pages = math.ceil(len(groups) / RESULTS_PER_PAGE)
+    start = (page - 1) * RESULTS_PER_PAGE
+    buttons = [
+        [InlineKeyboardButton(f"🎬 {title} ({len(ids)})", callback_data=f"grp|{search_id}|{i}")]
+        for i, (title, ids) in enumerate(groups[start:start + RESULTS_PER_PAGE], start)
+    ]
+
+    nav = []
+    if page > 1: nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"gpage|{search_id}|{page-1}"))
+    nav.append(InlineKeyboardButton(f"{page}/{total_pages}", callback_data="noop"))
+    if page < total_pages: nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"gpage|{search_id}|{page+1}"))
+    buttons.append(nav)
+    buttons.append([InlineKeyboardButton("❌ Close", callback_data="close_data")])
+
+    # Groups only cover the ranked top MAX_RESULTS rows, so say so when there are more matches
+    shown = sum(len(ids) for _, ids in groups)
+    if entry['total'] > shown: text = f"🔍 **Top {shown} of {entry['total']} files in {len(groups)} titles**"
+    else: text = f"🔍 **Found {shown} files in {len(groups)} titles**"
+    text += f"\n📄 Page {page}/{total_pages}"
+    if is_edit: await message.edit_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+    else:
+        sent = await message.reply_text(text, reply_markup=InlineKeyboardMarkup(buttons))
+        add_delete_task(sent.chat.id, sent.id, time.time() + RESULT_MSG_DELETE_TIME)
+
+async def open_group(message, search_id, index):
+    """Show one title's files as their own paged result list."""
+    entry = SEARCH_DATA_CACHE.get(search_id)
+    if not entry: return await message.edit_text("⚠️ Search expired.")
+    ids = entry["groups"][index][1]
+    group_id = str(uuid.uuid4())[:8]
+    SEARCH_DATA_CACHE[group_id] = {"ids": ids, "total": len(ids), "parent": search_id}
+    await send_results_page(message, group_id, page=1, is_edit=True)
+
 # ==============================================================================
 # 🎮 HANDLERS
 # ==============================================================================
@@ -374,40 +1567,176 @@ async def stats_handler(client, message):
         return await message.reply_text("❌ You are not the admin!")
     
     msg = await message.reply_text("⏳ Calculating...")
-    files = len(FILES_CACHE)
-    users = len(get_all_users())
+    files = len(FILE_STORE)
+    users = len(USER_IDS)
     ram = get_system_stats()
-    await msg.edit(f"📊 **Bot Stats**\n\n📂 Files: `{files}`\n👤 Users: `{users}`\n💾 RAM: `{ram}`")
+    await msg.edit(
+        f"📊 **Bot Stats**\n\n📂 Files: `{files}`\n👤 Users: `{users}`\n💾 RAM: `{ram}`\n\n"
+        f"🔎 Search Cache: `{SEARCH_DATA_CACHE.stats()}`\n💡 Suggestion Cache: `{SUGGESTION_CACHE.stats()}`\n"
+        f"⚡ Query Cache: `{QUERY_CACHE.stats()}`\n🎬 IMDb Cache: `{IMDB_CACHE.stats()}`, "
+        f"`{IMDB_STATS['lookups']}` lookups, `{IMDB_STATS['timeouts']}` timeouts"
+    )
+
+@app.on_message(filters.command("memory") & filters.user(ADMIN_ID))
+async def memory_handler(client, message):
+    report = await asyncio.get_running_loop().run_in_executor(None, lambda: f"{FILE_STORE.memory_report()}\n{SEARCH_INDEX.memory_report()}")
+    await message.reply_text(f"💾 **File Store Memory**\n\n{report}\n\nRSS: `{get_system_stats()}`")
 
 # 📥 INDEXING
+INDEX_JOBS = {}  # chat_id -> state of a running index job
+
 @app.on_message(filters.command("index") & filters.user(ADMIN_ID))
 async def index_channel(client, message):
-    if len(message.command) < 2: return await message.reply_text("❌ Usage: /index https://t.me/channel")
+    if len(message.command) < 2: return await message.reply_text("❌ Usage: /index https://t.me/channel [full]")
     target = message.command[1]
+    full = len(message.command) > 2 and message.command[2].lower() == "full"
     status_msg = await message.reply_text(f"⏳ Connecting to {target}...")
     try:
         chat = await client.get_chat(target)
-        chat_id = chat.id
-        await status_msg.edit(f"✅ Connected to {chat.title}\n⏳ Starting index...")
+        saved = await FIREBASE.get(f'index_state/{chat.id}') or {}
     except Exception as e: return await status_msg.edit(f"❌ Error: {e}")
-    
-    count = 0
-    new_files = 0
+    if chat.id in INDEX_JOBS: return await status_msg.edit(f"⏳ {chat.title} is already being indexed, see /indexstatus")
+
+    state = {
+        "chat_id": chat.id, "title": chat.title, "high": 0 if full else saved.get("high", 0),
+        "status_chat": status_msg.chat.id, "status_id": status_msg.id,
+        "top": 0, "next": 0, "scanned": 0, "added": 0, "failed": 0
+    }
+    if saved.get("next") and not full:
+        # An interrupted scan carries on below its checkpoint
+        state.update(top=saved["top"], next=saved["next"], high=saved.get("high", 0), scanned=saved["scanned"], added=saved["added"])
+        text = f"⏳ Resuming below message {state['next']}..."
+    elif state["high"]: text = f"⏳ Indexing messages after {state['high']}..."
+    else: text = "⏳ Starting index..."
+    # Registered before the next await, so a second /index for this chat sees the job
+    start_index(client, state)
+    await status_msg.edit(f"✅ Connected to {chat.title}\n{text}")
+
+@app.on_message(filters.command("indexstatus") & filters.user(ADMIN_ID))
+async def index_status_handler(client, message):
+    try: saved = await FIREBASE.get('index_state') or {}
+    except Exception as e: return await message.reply_text(f"❌ Error: {e}")
+    lines = []
+    for state in INDEX_JOBS.values():
+        lines.append(
+            f"🔄 **{state['title']}**: {state['scanned']} scanned, {state['added']} added, "
+            f"{state.get('rate', 0):.0f} msg/s, at message {state['next'] or '-'}"
+        )
+    for state in saved.values():
+        if state['chat_id'] in INDEX_JOBS: continue
+        if state.get("next"): lines.append(f"⏸️ **{state['title']}**: stopped at message {state['next']}, /index resumes it")
+        else: lines.append(f"✅ **{state['title']}**: indexed up to message {state['high']}")
+    await message.reply_text("📥 **Index Jobs**\n\n" + ("\n".join(lines) or "No channels indexed yet."))
+
+async def run_index(client, state):
+    """Walk a channel's history (newest first) down to its high-water mark.
+
+    `top` is the newest message of this scan and `next` its checkpoint: every
+    file above it is stored. Both are saved to Firebase `index_state/{chat_id}`
+    as chunks land, so a restart resumes below `next`; a clean finish makes
+    `top` the new high-water mark and later runs only fetch newer messages.
+    """
+    chat_id = state['chat_id']
+    loop = asyncio.get_running_loop()
+    chunks = asyncio.Queue(maxsize=INDEX_MAX_PENDING_CHUNKS)
+    healthy = {"ok": True}  # checkpoints stop advancing at the first chunk that could not be stored
+    save = lambda: FIREBASE.write_behind(f'index_state/{chat_id}', {k: v for k, v in state.items() if k != "rate"})
+    if not state['next']: state['top'] = 0
+
+    async def edit_status(text):
+        try: await client.edit_message_text(state['status_chat'], state['status_id'], text)
+        except: pass
+
+    async def write_chunk(chunk):
+        for attempt in range(INDEX_WRITE_RETRIES):
+            try:
+                await add_files_batch_to_db(chunk)
+                break
+            except Exception as e:
+                logger.warning(f"Index chunk write failed (try {attempt + 1}): {e}")
+                await asyncio.sleep(2 ** attempt)
+        else:
+            state["failed"] += len(chunk)
+            return False
+        norms = await loop.run_in_executor(None, lambda: [normalize_file(f) for f in chunk])
+        for file_data, norm in zip(chunk, norms):
+            if file_data['unique_id'] not in FILE_STORE: cache_file(file_data, norm)
+        state["added"] += len(chunk)
+        return True
+
+    async def writer():
+        while (item := await chunks.get()) is not None:
+            chunk, floor = item
+            try: stored = await write_chunk(chunk) if chunk else True
+            except Exception as e:
+                logger.error(f"Index chunk error: {e}")
+                state["failed"] += len(chunk)
+                stored = False
+            healthy["ok"] = healthy["ok"] and stored
+            if healthy["ok"]:
+                state['next'] = floor
+                save()
+
+    writer_task = asyncio.create_task(writer())
+    queued = set()
+    chunk = []
+    floor = state['next']
+    started, start_scanned = time.time(), state['scanned']
+    last_status = time.time()
+    error = None
     try:
-        async for msg in client.get_chat_history(chat_id):
-            if msg.document or msg.video:
-                media = msg.document or msg.video
+        async for msg in client.get_chat_history(chat_id, offset_id=state['next']):
+            if msg.id <= state['high']: break
+            if not state['top']: state['top'] = msg.id
+            floor = msg.id
+            state['scanned'] += 1
+            media = msg.document or msg.video
+            if media:
                 filename = getattr(media, "file_name", "Unknown")
                 data = {
                     "file_name": filename, "file_size": media.file_size,
                     "file_id": media.file_id, "unique_id": media.file_unique_id,
                     "caption": msg.caption or filename
                 }
-                if add_file_to_db(data): new_files += 1
-                count += 1
-                if count % 50 == 0: await status_msg.edit(f"🔄 Scanned: {count}\n✅ Added: {new_files}")
-        await status_msg.edit(f"✅ Complete! Added {new_files} files.")
-    except Exception as e: await status_msg.edit(f"❌ Error: {e}")
+                if data['unique_id'] not in FILE_STORE and data['unique_id'] not in queued:
+                    queued.add(data['unique_id'])
+                    chunk.append(data)
+            due = time.time() - last_status >= INDEX_STATUS_INTERVAL
+            # Partial chunks go out on every status tick too, so the checkpoint keeps moving
+            if len(chunk) >= INDEX_CHUNK_SIZE or due:
+                await chunks.put((chunk, floor))
+                chunk = []
+            if due:
+                last_status = time.time()
+                state['rate'] = (state['scanned'] - start_scanned) / (time.time() - started)
+                await edit_status(f"🔄 {state['title']}\nScanned: {state['scanned']}\n✅ Added: {state['added']}\n⚡ {state['rate']:.0f} msg/s")
+    except Exception as e: error = e
+    # Whatever was already fetched still gets written
+    await chunks.put((chunk, floor))
+    await chunks.put(None)
+    await writer_task
+
+    failed = f"\n⚠️ Failed: {state['failed']}, /index retries them" if state["failed"] else ""
+    if error or not healthy["ok"]:
+        save()
+        await edit_status(f"❌ Error: {error or 'some files could not be stored'}\n✅ Added: {state['added']}{failed}")
+    else:
+        FIREBASE.write_behind(f'index_state/{chat_id}', {"chat_id": chat_id, "title": state['title'], "high": state['top'] or state['high']})
+        await edit_status(f"✅ {state['title']} complete! Added {state['added']} files.")
+
+def start_index(client, state):
+    INDEX_JOBS[state['chat_id']] = state
+    task = asyncio.get_running_loop().create_task(run_index(client, state))
+    task.add_done_callback(lambda _: INDEX_JOBS.pop(state['chat_id'], None))
+
+async def resume_indexing(client):
+    try: saved = await FIREBASE.get('index_state') or {}
+    except Exception as e: return logger.error(f"Index Resume Error: {e}")
+    for state in saved.values():
+        if not state.get("next") or state['chat_id'] in INDEX_JOBS: continue
+        logger.info(f"📥 Resuming index of {state['title']} below message {state['next']}")
+        state['failed'] = 0
+        start_index(client, state)
 
 @app.on_message(filters.chat(CHANNEL_ID) & (filters.document | filters.video))
 async def index_new_post(client, message):
@@ -419,7 +1748,7 @@ async def index_new_post(client, message):
         "file_id": media.file_id, "unique_id": media.file_unique_id,
         "caption": message.caption or filename
     }
-    add_file_to_db(data)
+    await add_file_to_db(data)
 
 # 🗑️ DELETE COMMAND
 @app.on_message(filters.command("delete") & filters.user(ADMIN_ID))
@@ -432,7 +1761,7 @@ async def delete_handler(client, message):
         unique_id = message.command[1]
     
     if not unique_id: return await message.reply_text("❌ Reply to a file or provide ID.")
-    if delete_file_from_db(unique_id): await message.reply_text(f"🗑️ Deleted {unique_id}")
+    if await delete_file_from_db(unique_id): await message.reply_text(f"🗑️ Deleted {unique_id}")
     else: await message.reply_text("❌ Not found.")
 
 # 🔎 TEXT SEARCH
@@ -450,47 +1779,150 @@ async def search_handler(client, message):
 
 # ⚡ INLINE SEARCH (FIXED)
 @app.on_inline_query()
+@timed("inline_handler")
 async def inline_handler(client, query):
     text = query.query.strip()
     if not text: return
     
-    clean_q = clean_text(text)
-    raw_q = text.lower().split()
+    start = int(query.offset) if query.offset.isdigit() else 0
+    ranked = await inline_lookup(query.from_user.id, text)
     results = []
+    for row in ranked[start:start + INLINE_PAGE_SIZE]:
+        file = FILE_STORE.file(row)
+        if not file: continue
+        size = get_size(file['file_size'])
+        results.append(InlineQueryResultCachedDocument(
+            id=file['unique_id'],
+            title=file['file_name'][:50], # Telegram requires <64 chars for title
+            document_file_id=file['file_id'],
+            description=f"Size: {size}",
+            caption=f"📁 {file['file_name']}\n📊 Size: {size}\n\n🔗 via @{BOT_USERNAME}"
+        ))
     
-    count = 0
-    for file in FILES_CACHE:
-        if count >= 50: break
-        fname = clean_text(file.get('file_name', ''))
-        
-        # Match Logic
-        if clean_q in fname or (raw_q and all(w in file.get('file_name', '').lower() for w in raw_q)):
-            count += 1
-            size = get_size(file['file_size'])
-            results.append(InlineQueryResultCachedDocument(
-                id=file['unique_id'],
-                title=file['file_name'][:50], # Telegram requires <64 chars for title
-                document_file_id=file['file_id'],
-                description=f"Size: {size}",
-                caption=f"📁 {file['file_name']}\n📊 Size: {size}\n\n🔗 via @{BOT_USERNAME}"
-            ))
-            
-    await query.answer(results, cache_time=10)
+    # Results depend only on the query, so Telegram may share them between users
+    next_offset = str(start + INLINE_PAGE_SIZE) if start + INLINE_PAGE_SIZE < len(ranked) else ""
+    await query.answer(results, cache_time=inline_cache_time(), is_personal=False, next_offset=next_offset)
 
 # 📡 BROADCAST
 @app.on_message(filters.command("broadcast") & filters.user(ADMIN_ID))
 async def broadcast_handler(client, message):
-    if not message.reply_to_message: return await message.reply_text("❌ Reply to a message.")
-    users = get_all_users()
-    status = await message.reply_text(f"📤 Sending to {len(users)} users...")
-    success = 0
-    for user_id in users:
-        try:
-            await message.reply_to_message.copy(int(user_id))
-            success += 1
-            await asyncio.sleep(0.05)
+    source = message.reply_to_message
+    if not source or source.empty: return await message.reply_text("❌ Reply to a message.")
+    if ACTIVE_BROADCAST and not ACTIVE_BROADCAST.done(): return await message.reply_text("⏳ A broadcast is already running.")
+    # A resumed broadcast re-reads the source, so it must survive the auto-delete of searched texts
+    DELETE_SCHEDULER.cancel(source.chat.id, source.id)
+    status = await message.reply_text(f"📤 Sending to {len(USER_IDS)} users...")
+    start_broadcast(client, {
+        "from_chat": source.chat.id, "message_id": source.id,
+        "status_chat": status.chat.id, "status_id": status.id,
+        "cursor": 0, "sent": 0, "blocked": 0, "failed": 0
+    }, source)
+
+class TokenBucket:
+    """Async rate limiter; pause() holds every caller back, e.g. for a FloodWait."""
+    def __init__(self, rate, burst=1):
+        self.rate, self.burst = rate, burst
+        self.tokens, self.updated = burst, time.monotonic()
+        self.paused_until = 0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+# Only these prove the user is gone for good; PeerIdInvalid just means this session can't resolve them yet
+BLOCKED_ERRORS = (UserIsBlocked, InputUserDeactivated, UserDeactivated, UserDeactivatedBan)
+ACTIVE_BROADCAST = None
+
+def broadcast_status(state, title, rate=None):
+    text = (
+        f"{title}\n\n✅ Sent: {state['sent']}\n🚫 Blocked: {state['blocked']}\n❌ Failed: {state['failed']}\n"
+        f"📊 Progress: {state['sent'] + state['blocked'] + state['failed']}/{state['total']}"
+    )
+    return text + (f"\n⚡ Rate: {rate:.1f} msg/s" if rate is not None else "")
+
+async def run_broadcast(client, state, source):
+    """Copy `source` (fetched once) to every registered user.
+
+    Users are walked in id order; `state['cursor']` is the highest id below
+    which every user is done. It is checkpointed to Firebase `broadcast`, so a
+    restart resumes from there. Each user gets one message, so only the global
+    limit applies; the per-chat limit (1 msg/s) is never approached.
+    """
+    remaining = sorted(uid for uid in USER_IDS if uid > state['cursor'])
+    state['total'] = state['sent'] + state['blocked'] + state['failed'] + len(remaining)
+    users = iter(remaining)
+    bucket = TokenBucket(BROADCAST_RATE, burst=BROADCAST_SENDERS)
+    in_order = OrderedDict()  # user_id -> finished, in dispatch order
+    started, start_done = time.time(), state['sent'] + state['blocked'] + state['failed']
+
+    async def send(user_id):
+        while True:
+            await bucket.acquire()
+            try:
+                # copy() logs and returns None for messages it cannot send
+                return "sent" if await source.copy(user_id) else "failed"
+            except FloodWait as e:
+                logger.warning(f"Broadcast FloodWait: {e.value}s")
+                bucket.pause(e.value + 1)
+            except BLOCKED_ERRORS: return "blocked"
+            except Exception: return "failed"
+
+    async def sender():
+        for user_id in users:  # shared iterator, each id goes to one sender
+            in_order[user_id] = False
+            result = await send(user_id)
+            state[result] += 1
+            if result == "blocked": remove_user(user_id)
+            in_order[user_id] = True
+            while in_order and next(iter(in_order.values())):
+                state['cursor'] = in_order.popitem(last=False)[0]
+
+    async def report():
+        while True:
+            await asyncio.sleep(BROADCAST_REPORT_INTERVAL)
+            FIREBASE.write_behind('broadcast', dict(state))
+            done = state['sent'] + state['blocked'] + state['failed'] - start_done
+            try: await client.edit_message_text(state['status_chat'], state['status_id'], broadcast_status(state, "📤 Broadcasting...", done / (time.time() - started)))
+            except: pass
+
+    reporter = asyncio.create_task(report())
+    try: await asyncio.gather(*[sender() for _ in range(BROADCAST_SENDERS)])
+    finally: reporter.cancel()
+    FIREBASE.write_behind('broadcast', None)
+    try: await client.edit_message_text(state['status_chat'], state['status_id'], broadcast_status(state, "✅ Broadcast finished."))
+    except: pass
+
+def start_broadcast(client, state, source):
+    global ACTIVE_BROADCAST
+    FIREBASE.write_behind('broadcast', dict(state))
+    ACTIVE_BROADCAST = asyncio.get_running_loop().create_task(run_broadcast(client, state, source))
+
+async def resume_broadcast(client):
+    try:
+        state = await FIREBASE.get('broadcast')
+        if not state: return
+        source = await client.get_messages(state['from_chat'], state['message_id'])
+    except Exception as e: return logger.error(f"Broadcast Resume Error: {e}")
+    if not source or source.empty:
+        logger.error(f"Broadcast Resume Error: message {state['message_id']} no longer exists")
+        FIREBASE.write_behind('broadcast', None)
+        try: await client.edit_message_text(state['status_chat'], state['status_id'], "❌ Broadcast stopped: its message was deleted.")
         except: pass
-    await status.edit(f"✅ Broadcast sent to {success} users.")
+        return
+    logger.info(f"📤 Resuming broadcast after user {state['cursor']}")
+    start_broadcast(client, state, source)
 
 # 📨 CALLBACKS
 @app.on_callback_query()
@@ -503,6 +1935,12 @@ async def callback_handler(client, cb):
     elif data[0] == "page":
         await send_results_page(cb.message, data[1], int(data[2]), is_edit=True)
         await cb.answer()
+    elif data[0] == "gpage":
+        await send_groups_page(cb.message, data[1], int(data[2]), is_edit=True)
+        await cb.answer()
+    elif data[0] == "grp":
+        await open_group(cb.message, data[1], int(data[2]))
+        await cb.answer()
     elif data[0] == "suggest":
         # Short ID Logic
         short_id = data[1]
@@ -520,6 +1958,7 @@ async def callback_handler(client, cb):
     elif data[0] == "noop":
         await cb.answer()
 
+@timed("send_file_to_user")
 async def send_file_to_user(client, chat_id, unique_id):
     file_data = get_file_by_id(unique_id)
     if not file_data: return await client.send_message(chat_id, "❌ File removed.")
@@ -531,13 +1970,23 @@ async def send_file_to_user(client, chat_id, unique_id):
 if __name__ == "__main__":
     threading.Thread(target=run_http_server, daemon=True).start()
     refresh_cache()
+    if SEARCH_WORKERS: SEARCH_POOL = SearchPool(SEARCH_WORKERS)
+    DELETE_SCHEDULER.load()
+    load_users()
+    load_imdb_cache()
     print("🤖 Bot Starting...")
     app.start()
     me = app.get_me()
     BOT_USERNAME = me.username
     loop = asyncio.get_event_loop()
     loop.create_task(background_tasks())
+    loop.create_task(resume_broadcast(app))
+    loop.create_task(resume_indexing(app))
     print(f"✅ Bot Started as @{BOT_USERNAME}")
     from pyrogram import idle
     idle()
+    FIREBASE.flush_sync()
+    if SYNC_STATE['dirty']: write_snapshot(*snapshot_rows())
+    save_imdb_cache()
+    if SEARCH_POOL: SEARCH_POOL.close()
     app.stop()